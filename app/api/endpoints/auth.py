@@ -8,10 +8,13 @@
 # ─────────────────────────────────────────────────────────────────────────────
 
 import os
+import hashlib
 import logging
-from datetime import datetime, timedelta
-from time import time
+import secrets
+from datetime import datetime, timedelta, timezone
 
+from cachetools import TTLCache
+from redis.exceptions import RedisError
 from fastapi import (
     APIRouter,
     Depends,
@@ -26,12 +29,14 @@ from app.core.auth import (
     create_access_token,
     get_current_user,
     hash_password,
-    verify_password,
+    invalidate_cached_user,
+    verify_password_cached,
 )
 from app.core.config import ACCESS_TOKEN_EXPIRE_MINUTES, API_COOKIE_DOMAIN
 from app.core.database import users_collection
+from app.core.redis_client import redis_client
 from app.models.users import User, UserPublic
-from app.utils.cookies import attach_auth_cookies
+from app.utils.cookies import attach_auth_cookies, build_logout_cookie_headers
 from app.core.limiter import limiter
 
 router = APIRouter()
@@ -39,7 +44,69 @@ router = APIRouter()
 # --- Configuración de rate limiting y bloqueo temporal ---
 MAX_LOGIN_ATTEMPTS = 5
 BLOCK_TIME_SECONDS = 10  # 5 minutos
-login_attempts = {}  # {username: {"count": int, "last_attempt": float, "blocked_until": float}}
+# Ventana durante la que se acumulan los intentos fallidos (se reinicia con un login exitoso).
+# Es independiente del bloqueo: intentos espaciados también terminan bloqueando.
+LOGIN_FAILURE_WINDOW_SECONDS = 15 * 60
+
+# Hash ficticio para verificar contra él cuando el usuario no existe: así el tiempo
+# de respuesta no revela si la cuenta existe (siempre se paga una ronda de bcrypt)
+DUMMY_PASSWORD_HASH = hash_password("unused-dummy-password-" + secrets.token_hex(8))
+
+# Incrementa el contador de fallos y fija su expiración en el primer intento (atómico en Redis)
+LOGIN_FAIL_SCRIPT = (
+    "local n=redis.call('INCR',KEYS[1]); "
+    "if n==1 then redis.call('EXPIRE',KEYS[1],ARGV[1]) end; "
+    "return n"
+)
+
+# Fallback en memoria (acotado y con expiración) cuando no hay Redis configurado o no responde
+_local_login_failures = TTLCache(maxsize=10_000, ttl=LOGIN_FAILURE_WINDOW_SECONDS)
+_local_login_blocks = TTLCache(maxsize=10_000, ttl=BLOCK_TIME_SECONDS)
+
+
+async def is_login_blocked(username_key: str) -> bool:
+    """Indica si el usuario tiene el login bloqueado temporalmente."""
+    if redis_client:
+        try:
+            return bool(await redis_client.exists(f"login_block:{username_key}"))
+        except RedisError as e:
+            logging.error(f"[LOGIN] Error consultando bloqueo en Redis, se usa el fallback en memoria: {str(e)}")
+    return username_key in _local_login_blocks
+
+
+async def register_failed_login(username_key: str):
+    """Suma un intento fallido y bloquea al usuario al alcanzar el máximo."""
+    if redis_client:
+        try:
+            count = await redis_client.eval(
+                LOGIN_FAIL_SCRIPT, 1, f"login_fail:{username_key}", LOGIN_FAILURE_WINDOW_SECONDS
+            )
+            if count >= MAX_LOGIN_ATTEMPTS:
+                await redis_client.set(f"login_block:{username_key}", 1, ex=BLOCK_TIME_SECONDS, nx=True)
+                await redis_client.delete(f"login_fail:{username_key}")  # Reinicia el contador tras bloquear
+            return
+        except RedisError as e:
+            logging.error(f"[LOGIN] Error registrando intento fallido en Redis, se usa el fallback en memoria: {str(e)}")
+
+    count = _local_login_failures.get(username_key, 0) + 1
+    if count >= MAX_LOGIN_ATTEMPTS:
+        _local_login_blocks[username_key] = True
+        _local_login_failures.pop(username_key, None)  # Reinicia el contador tras bloquear
+    else:
+        _local_login_failures[username_key] = count
+
+
+async def clear_login_attempts(username_key: str):
+    """Limpia contador y bloqueo tras un login exitoso."""
+    if redis_client:
+        try:
+            await redis_client.delete(f"login_fail:{username_key}", f"login_block:{username_key}")
+        except RedisError as e:
+            logging.error(f"[LOGIN] Error limpiando intentos en Redis: {str(e)}")
+    # También se limpia el fallback, por si se usó durante una caída de Redis
+    _local_login_failures.pop(username_key, None)
+    _local_login_blocks.pop(username_key, None)
+
 
 # ─────────────────────────── REGISTRO ELIMINADO ────────────────────────────
 # El endpoint /register ha sido movido a user_registration.py
@@ -60,33 +127,28 @@ async def login_for_access_token(
     • En caso contrario responde *403 Forbidden*.
     • Aplica rate limiting y bloqueo temporal tras varios intentos fallidos.
     """
-    global login_attempts
-    now = time()
+    username_key = username.lower()
     # --- Rate limiting y bloqueo temporal ---
-    user_attempt = login_attempts.get(username, {"count": 0, "last_attempt": 0, "blocked_until": 0})
-    if user_attempt.get("blocked_until", 0) > now:
+    if await is_login_blocked(username_key):
         logging.warning(f"Intento de login bloqueado para usuario {username} desde IP {request.client.host if request else 'unknown'}")
         raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Demasiados intentos fallidos. Intenta nuevamente en unos minutos.")
 
-    # Obtiene al usuario (case insensitive)
-    user_data = await users_collection.find_one({"username": {"$regex": f"^{username}$", "$options": "i"}})
-    if not user_data or not verify_password(password, user_data["password_hash"]):
+    # Obtiene al usuario (case insensitive, vía campo normalizado e indexado)
+    user_data = await users_collection.find_one(
+        {"username_lower": username_key}, {"username": 1, "password_hash": 1, "status": 1}
+    )
+    stored_hash = user_data["password_hash"] if user_data else DUMMY_PASSWORD_HASH
+    password_ok = await verify_password_cached(username, password, stored_hash)
+    if not user_data or not password_ok:
         # Logging de intento fallido
         logging.warning(f"Login fallido para usuario {username} desde IP {request.client.host if request else 'unknown'}")
-        # Actualiza contador de intentos
-        user_attempt["count"] = user_attempt.get("count", 0) + 1
-        user_attempt["last_attempt"] = now
-        # Si supera el máximo, bloquea
-        if user_attempt["count"] >= MAX_LOGIN_ATTEMPTS:
-            user_attempt["blocked_until"] = now + BLOCK_TIME_SECONDS
-            user_attempt["count"] = 0  # Reinicia el contador tras bloquear
-        login_attempts[username] = user_attempt
+        # Actualiza contador de intentos (y bloquea si supera el máximo)
+        await register_failed_login(username_key)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciales inválidas"
         )
     # Si login exitoso, limpia el registro de intentos
-    if username in login_attempts:
-        del login_attempts[username]
+    await clear_login_attempts(username_key)
 
     # ¿Cuenta eliminada?
     if user_data.get("status") == "deleted":
@@ -111,7 +173,7 @@ async def login_for_access_token(
     # Actualiza último login
     await users_collection.update_one(
         {"_id": user_data["_id"]},
-        {"$set": {"last_login": datetime.utcnow()}},
+        {"$set": {"last_login": datetime.now(timezone.utc)}},
     )
 
     # Coloca cookies (token + CSRF)
@@ -128,19 +190,50 @@ async def login_for_access_token(
 
 
 # ───────────────────────────── /me ────────────────────────────────
+# El usuario no guarda `updated_at`, así que la huella se calcula con los propios
+# campos públicos: cualquier cambio visible en /me produce un ETag distinto.
+ME_CACHE_CONTROL = "private, no-cache"
+
+
+def user_public_etag(user: User) -> str:
+    fingerprint = "|".join(str(getattr(user, name)) for name in UserPublic.model_fields)
+    return '"' + hashlib.blake2b(fingerprint.encode(), digest_size=8).hexdigest() + '"'
+
+
 @router.get("/me", response_model=UserPublic)
 @limiter.limit("45/minute")
-async def read_users_me(current_user: User = Depends(get_current_user), request: Request = None):
-    return UserPublic(**current_user.model_dump())
+async def read_users_me(
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    request: Request = None,
+):
+    etag = user_public_etag(current_user)
+    if_none_match = request.headers.get("if-none-match") if request is not None else None
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": etag, "Cache-Control": ME_CACHE_CONTROL},
+        )
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = ME_CACHE_CONTROL
+    # `current_user` ya está validado: se copian los campos públicos sin volver a validar
+    return UserPublic.model_construct(
+        **{name: getattr(current_user, name) for name in UserPublic.model_fields}
+    )
 
 
 # ──────────────────────────── /logout ─────────────────────────────
+# Headers de borrado de cookies precalculados (no dependen del request)
+LOGOUT_COOKIE_HEADERS = build_logout_cookie_headers(API_COOKIE_DOMAIN or None)
+
 @router.post("/logout", response_model=dict)
 @limiter.limit("30/minute")
 async def logout(response: Response, request: Request = None):
     """
     Borra cookies de sesión (token + csrf_token).
     """
-    for name in ("token", "csrf_token"):
-        response.delete_cookie(name, path="/", domain=API_COOKIE_DOMAIN or None)
+    if request is not None:
+        await invalidate_cached_user(request.cookies.get("token"))
+    response.raw_headers.extend(LOGOUT_COOKIE_HEADERS)
     return {"message": "Logout successful"}
@@ -5,23 +5,47 @@ from bson import ObjectId
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from typing import List, Optional
 from pydantic import BaseModel
+from pymongo import ReturnDocument
 from math import ceil
 from urllib.parse import urlparse
-import unicodedata
-import re
 
-from app.core.database import docs_collection
+from app.core.database import docs_collection, SPANISH_COLLATION
 from app.models.users import User
 from app.core.auth import get_current_user
-from app.core.s3_client import get_presigned_url_from_image_path, s3_client, S3_BUCKET_NAME
+from app.core.s3_client import presign_image_paths, s3_client, S3_BUCKET_NAME
 from app.models.docs import DocFile
 from app.services.graph_nodes.n4_validate import validate
 from app.services.download_service import get_document_download_url, get_document_filename
 from app.main import limiter
-from app.utils.accent_regex import build_accent_insensitive_regex
+from app.services.document_counts import (
+    document_count_key,
+    get_cached_document_count,
+    invalidate_tenant_counts,
+    set_cached_document_count,
+)
+from app.utils.json_response import FastJSONResponse
+from app.utils.page_relevance import relevant_page_expr
+from app.utils.search_normalization import SEARCH_FIELDS, build_search_fields, search_prefix_bounds
 
 router = APIRouter()
 
+# Campos de texto cuyo orden requiere collation (el resto se compara en binario, sin ICU)
+COLLATED_SORT_FIELDS = {"name", "uploaded_by", "company_info.company_name"}
+
+# Borrado de objetos en S3
+S3_DELETE_BATCH_SIZE = 1000  # Máximo de claves por llamada a delete_objects
+S3_DELETE_MAX_CONCURRENCY = 8
+
+# Excluye las cargas directas no confirmadas (DocFiles creados por /upload_session sin PDF aún)
+UPLOAD_CONFIRMED_FILTER = {"upload_pending": {"$exists": False}}
+
+def parse_object_id(docfile_id: str) -> ObjectId:
+    """Dependencia: valida el ID del path y lo convierte a ObjectId (400 si es inválido)."""
+    if not ObjectId.is_valid(docfile_id):
+        raise HTTPException(status_code=400, detail="ID de documento inválido")
+    return ObjectId(docfile_id)
+
+
 class DocsListResponse(BaseModel):
     total: int
     page: int
@@ -77,27 +101,24 @@ async def list_documents(
 
     # Filtrar por tenant del usuario
     tenant_id = current_user.tenant_id
-    query_filter = {"tenant_id": tenant_id}
+    query_filter = {"tenant_id": tenant_id, **UPLOAD_CONFIRMED_FILTER}
     
-    if q:
-        accent_regex = build_accent_insensitive_regex(q)
-        query_filter["$or"] = [
-            {"name": {"$regex": accent_regex, "$options": "i"}},
-            {"uploaded_by": {"$regex": accent_regex, "$options": "i"}},
-            {"company_info.company_name": {"$regex": accent_regex, "$options": "i"}},
-            {"company_info.company_cuit": {"$regex": accent_regex, "$options": "i"}},
-        ]
+    q_bounds = search_prefix_bounds(q) if q else None
+    if q_bounds:
+        # Búsqueda por prefijo sobre campos normalizados (sin tildes, minúsculas) como rango indexado
+        q_range = {"$gte": q_bounds[0], "$lt": q_bounds[1]}
+        query_filter["$or"] = [{field: q_range} for field in SEARCH_FIELDS]
     if status:
         query_filter["status"] = status
     if validation_status:
         query_filter["validation.status"] = validation_status
 
-    total = await docs_collection.count_documents(query_filter, collation={"locale": "es", "strength": 1})
-    total_pages = ceil(total / page_size) if total > 0 else 1
     skip = (page - 1) * page_size
 
+    # El `id` string se genera en el servidor: no hace falta recorrer los resultados en Python
     projection = {
-        "_id": 1,
+        "_id": 0,
+        "id": {"$toString": "$_id"},
         "name": 1,
         "status": 1,
         "upload_date": 1,
@@ -111,20 +132,35 @@ async def list_documents(
         "page_count": 1
     }
 
-    cursor = (
-        docs_collection.find(query_filter, projection, collation={"locale": "es", "strength": 1})
-        .sort(db_sort_field, sort_direction)
-        .skip(skip)
-        .limit(page_size)
-    )
-    docs_list = await cursor.to_list(length=page_size)
+    items_stages = [
+        {"$sort": {db_sort_field: sort_direction}},
+        {"$skip": skip},
+        {"$limit": page_size},
+        {"$project": projection},
+    ]
+    # La búsqueda `q` usa campos ya normalizados: la collation solo hace falta para ordenar texto
+    aggregate_options = {"collation": SPANISH_COLLATION} if db_sort_field in COLLATED_SORT_FIELDS else {}
 
-    for doc in docs_list:
-        doc["id"] = str(doc.pop("_id"))
-        if "company_info" in doc:
-            doc["company_info"] = {
-                k: v for k, v in doc["company_info"].items() if k in ["company_name", "company_cuit"]
-            }
+    count_key = document_count_key(tenant_id, q_bounds, status, validation_status)
+    total = get_cached_document_count(count_key)
+
+    if total is None:
+        # Página y total en una sola agregación: un round-trip y un único recorrido del índice
+        pipeline = [
+            {"$match": query_filter},
+            {"$facet": {"items": items_stages, "meta": [{"$count": "total"}]}},
+        ]
+        cursor = docs_collection.aggregate(pipeline, **aggregate_options)
+        result = (await cursor.to_list(length=1))[0]
+        docs_list = result["items"]
+        total = result["meta"][0]["total"] if result["meta"] else 0
+        set_cached_document_count(count_key, total)
+    else:
+        # Total cacheado (paginando con el mismo filtro): solo se consulta la página
+        cursor = docs_collection.aggregate([{"$match": query_filter}, *items_stages], **aggregate_options)
+        docs_list = await cursor.to_list(length=page_size)
+
+    total_pages = ceil(total / page_size) if total > 0 else 1
 
     return DocsListResponse(
         total=total,
@@ -143,11 +179,11 @@ async def list_documents(
 @limiter.limit("30/minute")
 async def get_document(
     docfile_id: str,
+    object_id: ObjectId = Depends(parse_object_id),
     current_user: User = Depends(get_current_user),
     request: Request = None
 ):
     try:
-        object_id = ObjectId(docfile_id)
         tenant_id = current_user.tenant_id
         
         # Verificar que el documento pertenece al tenant del usuario
@@ -156,10 +192,37 @@ async def get_document(
             {
                 "$match": {
                     "_id": object_id,
-                    "tenant_id": tenant_id
+                    "tenant_id": tenant_id,
+                    **UPLOAD_CONFIRMED_FILTER,
+                }
+            },
+            {
+                # Solo páginas relevantes: se toman por índice desde `relevant_page_ids`
+                # (calculado al escribir). Si falta, se recorren las páginas con el mismo criterio.
+                "$addFields": {
+                    "pages": {
+                        "$cond": [
+                            {"$isArray": "$relevant_page_ids"},
+                            {
+                                "$map": {
+                                    "input": "$relevant_page_ids",
+                                    "as": "i",
+                                    "in": {"$arrayElemAt": ["$pages", "$$i"]},
+                                }
+                            },
+                            {
+                                "$filter": {
+                                    "input": "$pages",
+                                    "as": "page",
+                                    "cond": relevant_page_expr("$$page"),
+                                }
+                            },
+                        ]
+                    }
                 }
             },
             {
+                # Solo los campos que devuelve la respuesta (sin tenant_id ni campos de búsqueda)
                 "$project": {
                     "_id": 1,
                     "name": 1,
@@ -176,22 +239,7 @@ async def get_document(
                     "upload_path": 1,
                     "balance_data": 1,
                     "income_statement_data": 1,
-                    "company_info": 1,
-                    "tenant_id": 1,
-                    # Filtrar solo páginas relevantes
-                    "pages": {
-                        "$filter": {
-                            "input": "$pages",
-                            "as": "page",
-                            "cond": {
-                                "$or": [
-                                    {"$eq": [{"$ifNull": ["$$page.recognized_info.is_balance_sheet", False]}, True]},
-                                    {"$eq": [{"$ifNull": ["$$page.recognized_info.is_income_statement_sheet", False]}, True]},
-                                    {"$ne": [{"$ifNull": ["$$page.company_info", None]}, None]}
-                                ]
-                            }
-                        }
-                    }
+                    "pages": 1,
                 }
             }
         ]
@@ -205,34 +253,18 @@ async def get_document(
         document = documents[0]
         document["id"] = str(document.pop("_id"))
         
-        # Generar URLs pre-firmadas en paralelo para mejor rendimiento
-        if "pages" in document and document["pages"]:
-            async def generate_presigned_url_async(page):
-                """Genera URL pre-firmada de forma asíncrona"""
-                if "image_path" in page:
-                    try:
-                        # Ejecutar la función síncrona en un thread separado
-                        page["image_path"] = await asyncio.to_thread(
-                            get_presigned_url_from_image_path, 
-                            page["image_path"]
-                        )
-                    except Exception as e:
-                        # Mantener la URL original si falla
-                        pass
-                return page
-            
-            # Procesar todas las páginas en paralelo
-            document["pages"] = await asyncio.gather(
-                *[generate_presigned_url_async(page) for page in document["pages"]]
-            )
+        # Generar URLs pre-firmadas en lote (si alguna falla se mantiene la URL original)
+        pages_with_image = [page for page in document.get("pages") or [] if "image_path" in page]
+        presigned_urls = await presign_image_paths([page["image_path"] for page in pages_with_image])
+        for page, presigned_url in zip(pages_with_image, presigned_urls):
+            page["image_path"] = presigned_url
         
-        return document
+        # Se serializa directo con orjson (sin pasar por jsonable_encoder): el documento es grande
+        return FastJSONResponse(content=document)
     except HTTPException:
         # Re-lanzar excepciones HTTP ya manejadas
         raise
     except Exception as e:
-        if "Invalid ObjectId" in str(e):
-            raise HTTPException(status_code=400, detail="ID de documento inválido")
         raise HTTPException(status_code=500, detail=f"Error al obtener el documento: {str(e)}")
 
 
@@ -253,17 +285,11 @@ async def download_document_pdf(
     Esto evita que el archivo pase por el servidor backend, mejorando el rendimiento.
     """
     try:
-        # Obtener la URL pre-firmada del servicio
-        download_url = await get_document_download_url(docfile_id, current_user)
+        # Obtener la URL pre-firmada y el documento (una sola consulta a la BD)
+        download_url, document = await get_document_download_url(docfile_id, current_user)
         
-        # Obtener información del documento para generar un nombre de archivo apropiado
-        object_id = ObjectId(docfile_id)
-        tenant_id = current_user.tenant_id
-        document = await docs_collection.find_one({
-            "_id": object_id,
-            "tenant_id": tenant_id
-        })
-        filename = get_document_filename(document) if document else f"documento_{docfile_id}.pdf"
+        # Nombre de archivo apropiado a partir del documento ya consultado
+        filename = get_document_filename(document)
         
         return {
             "download_url": download_url,
@@ -287,17 +313,26 @@ async def download_document_pdf(
 async def update_docfile(
     docfile_id: str,
     updated_data: dict,
+    object_id: ObjectId = Depends(parse_object_id),
     current_user: User = Depends(get_current_user),
     request: Request = None
 ):
     try:
-        object_id = ObjectId(docfile_id)
         tenant_id = current_user.tenant_id
         
         # Preparar los datos para actualización
         # Remover campos que no deben ser actualizados o que son generados
-        fields_to_remove = ["id", "_id", "upload_date", "uploaded_by", "tenant_id", "pages"]
+        fields_to_remove = ["id", "_id", "upload_date", "uploaded_by", "tenant_id", "pages", "relevant_page_ids", *SEARCH_FIELDS]
         update_dict = {k: v for k, v in updated_data.items() if k not in fields_to_remove}
+
+        # Mantener sincronizados los campos normalizados de búsqueda
+        if "name" in update_dict:
+            update_dict.update(build_search_fields(name=update_dict["name"]))
+        if isinstance(update_dict.get("company_info"), dict):
+            update_dict.update(build_search_fields(
+                company_name=update_dict["company_info"].get("company_name"),
+                company_cuit=update_dict["company_info"].get("company_cuit"),
+            ))
         
         # Convertir strings de fecha a datetime si es necesario
         from datetime import datetime
@@ -309,66 +344,43 @@ async def update_docfile(
                     # Si falla la conversión, mantener el valor original
                     pass
         
-        # Sincronizar fechas con balance_data e income_statement_data para exportación
-        # Esto asegura que las fechas editadas se reflejen en todas las estructuras internas
-        if "balance_date" in update_dict or "balance_date_previous" in update_dict:
-            # Obtener documento actual para sincronizar
-            current_doc = await docs_collection.find_one(
-                {"_id": object_id, "tenant_id": tenant_id},
-                {"balance_data": 1, "income_statement_data": 1}
-            )
-            
-            if current_doc:
-                # Sincronizar balance_date (periodo_actual)
-                if "balance_date" in update_dict:
-                    # Actualizar en balance_data
-                    if current_doc.get("balance_data"):
-                        if "balance_data" not in update_dict:
-                            update_dict["balance_data"] = current_doc["balance_data"]
-                        if "informacion_general" not in update_dict["balance_data"]:
-                            update_dict["balance_data"]["informacion_general"] = update_dict["balance_data"].get("informacion_general", {})
-                        update_dict["balance_data"]["informacion_general"]["periodo_actual"] = update_dict["balance_date"]
-                    
-                    # Actualizar en income_statement_data
-                    if current_doc.get("income_statement_data"):
-                        if "income_statement_data" not in update_dict:
-                            update_dict["income_statement_data"] = current_doc["income_statement_data"]
-                        if "informacion_general" not in update_dict["income_statement_data"]:
-                            update_dict["income_statement_data"]["informacion_general"] = update_dict["income_statement_data"].get("informacion_general", {})
-                        update_dict["income_statement_data"]["informacion_general"]["periodo_actual"] = update_dict["balance_date"]
-                
-                # Sincronizar balance_date_previous (periodo_anterior)
-                if "balance_date_previous" in update_dict:
-                    # Actualizar en balance_data
-                    if current_doc.get("balance_data"):
-                        if "balance_data" not in update_dict:
-                            update_dict["balance_data"] = current_doc["balance_data"]
-                        if "informacion_general" not in update_dict["balance_data"]:
-                            update_dict["balance_data"]["informacion_general"] = update_dict["balance_data"].get("informacion_general", {})
-                        update_dict["balance_data"]["informacion_general"]["periodo_anterior"] = update_dict["balance_date_previous"]
-                    
-                    # Actualizar en income_statement_data
-                    if current_doc.get("income_statement_data"):
-                        if "income_statement_data" not in update_dict:
-                            update_dict["income_statement_data"] = current_doc["income_statement_data"]
-                        if "informacion_general" not in update_dict["income_statement_data"]:
-                            update_dict["income_statement_data"]["informacion_general"] = update_dict["income_statement_data"].get("informacion_general", {})
-                        update_dict["income_statement_data"]["informacion_general"]["periodo_anterior"] = update_dict["balance_date_previous"]
-        
+        # Primera etapa: los valores del cliente van como $literal para que Mongo no
+        # interprete strings que empiecen con "$" ni fusione objetos embebidos.
+        update_pipeline = [{"$set": {k: {"$literal": v} for k, v in update_dict.items()}}]
+
+        # Sincronizar fechas con balance_data e income_statement_data para exportación.
+        # Se hace en el servidor, sobre el documento ya actualizado, sin leerlo antes.
+        period_fields = {}
+        if "balance_date" in update_dict:
+            period_fields["periodo_actual"] = update_dict["balance_date"]
+        if "balance_date_previous" in update_dict:
+            period_fields["periodo_anterior"] = update_dict["balance_date_previous"]
+        if period_fields:
+            update_pipeline.append({"$set": {
+                section: {"$cond": [
+                    {"$eq": [{"$type": f"${section}"}, "object"]},
+                    {"$mergeObjects": [
+                        f"${section}",
+                        {"informacion_general": {"$mergeObjects": [
+                            {"$ifNull": [f"${section}.informacion_general", {}]},
+                            {"$literal": period_fields},
+                        ]}},
+                    ]},
+                    f"${section}",
+                ]}
+                for section in ("balance_data", "income_statement_data")
+            }})
+
         # Solo permitir actualizar documentos del propio tenant
-        result = await docs_collection.update_one(
+        updated_document = await docs_collection.find_one_and_update(
             {"_id": object_id, "tenant_id": tenant_id},
-            {"$set": update_dict}
+            update_pipeline,
+            return_document=ReturnDocument.AFTER,
         )
-        if result.matched_count == 0:
+        if updated_document is None:
             raise HTTPException(status_code=404, detail="Documento no encontrado")
-        
-        updated_document = await docs_collection.find_one({
-            "_id": object_id,
-            "tenant_id": tenant_id
-        })
-        if updated_document:
-            updated_document["id"] = str(updated_document.pop("_id"))
+        updated_document["id"] = str(updated_document.pop("_id"))
+        invalidate_tenant_counts(tenant_id)
         
         # Ejecutar validación después de actualizar
         await validate({
@@ -384,8 +396,6 @@ async def update_docfile(
         import traceback
         error_detail = f"Error al actualizar el documento: {str(e)}\n{traceback.format_exc()}"
         print(error_detail)  # Para debugging en logs del servidor
-        if "Invalid ObjectId" in str(e):
-            raise HTTPException(status_code=400, detail="ID de documento inválido")
         raise HTTPException(status_code=500, detail=f"Error al actualizar el documento: {str(e)}")
 
 
@@ -401,6 +411,7 @@ async def update_docfile(
 @limiter.limit("5/minute")
 async def delete_document(
     docfile_id: str,
+    object_id: ObjectId = Depends(parse_object_id),
     current_user: User = Depends(get_current_user),
     request: Request = None,
 ):
@@ -409,45 +420,60 @@ async def delete_document(
     - PDF subido (`upload_path`)
     - Imágenes asociadas a cada página
     """
-    try:
-        object_id = ObjectId(docfile_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="ID de documento inválido")
-
     tenant_id = current_user.tenant_id
     
-    # Solo permitir borrar documentos del propio tenant
-    document = await docs_collection.find_one({
-        "_id": object_id,
-        "tenant_id": tenant_id
-    })
-    if not document:
+    # Solo permitir borrar documentos del propio tenant.
+    # Se proyectan únicamente las rutas a S3 (sin traer el contenido OCR de las páginas).
+    cursor = docs_collection.aggregate([
+        {"$match": {"_id": object_id, "tenant_id": tenant_id}},
+        {"$project": {
+            "_id": 0,
+            "paths": {"$concatArrays": [
+                [{"$ifNull": ["$upload_path", None]}],
+                {"$map": {
+                    "input": {"$ifNull": ["$pages", []]},
+                    "as": "p",
+                    "in": "$$p.image_path",
+                }},
+            ]},
+        }},
+    ])
+    result = await cursor.to_list(length=1)
+    if not result:
         raise HTTPException(status_code=404, detail="Documento no encontrado")
 
     def extract_key(full_url: str) -> str:
         return urlparse(full_url).path.lstrip("/")
 
-    s3_keys: list[str] = []
-
-    if document.get("upload_path"):
-        s3_keys.append(extract_key(document["upload_path"]))
+    s3_keys: list[str] = [extract_key(path) for path in result[0]["paths"] if path]
 
-    for page in document.get("pages", []):
-        if page.get("image_path"):
-            s3_keys.append(extract_key(page["image_path"]))
+    # El borrado en Mongo no depende de S3: corre en paralelo con los lotes de delete_objects
+    mongo_delete = asyncio.create_task(docs_collection.delete_one({"_id": object_id, "tenant_id": tenant_id}))
 
     delete_errors = []
     if s3_keys:
-        for i in range(0, len(s3_keys), 1000):
-            batch = [{"Key": k} for k in s3_keys[i : i + 1000]]
-            resp = await asyncio.to_thread(
-                s3_client.delete_objects,
-                Bucket=S3_BUCKET_NAME,
-                Delete={"Objects": batch},
-            )
-            delete_errors.extend(resp.get("Errors", []))
-
-    await docs_collection.delete_one({"_id": object_id})
+        # Lotes de hasta 1000 claves (límite de S3) enviados en paralelo, con concurrencia acotada.
+        # "Quiet" hace que S3 devuelva solo los errores.
+        batches = [s3_keys[i : i + S3_DELETE_BATCH_SIZE] for i in range(0, len(s3_keys), S3_DELETE_BATCH_SIZE)]
+        semaphore = asyncio.Semaphore(S3_DELETE_MAX_CONCURRENCY)
+
+        async def delete_batch(batch: list[str]):
+            async with semaphore:
+                return await asyncio.to_thread(
+                    s3_client.delete_objects,
+                    Bucket=S3_BUCKET_NAME,
+                    Delete={"Objects": [{"Key": k} for k in batch], "Quiet": True},
+                )
+
+        responses = await asyncio.gather(*(delete_batch(b) for b in batches), return_exceptions=True)
+        for batch, resp in zip(batches, responses):
+            if isinstance(resp, Exception):
+                delete_errors.extend({"Key": k, "Message": str(resp)} for k in batch)
+            else:
+                delete_errors.extend(resp.get("Errors", []))
+
+    await mongo_delete
+    invalidate_tenant_counts(tenant_id)
 
     return {
         "message": "Documento eliminado correctamente",
@@ -1,9 +1,14 @@
 # app/api/endpoints/processing.py
 
+import asyncio
+from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFile, File, Request
 from typing import List
 from bson import ObjectId
+from pydantic import BaseModel
 from app.core.database import docs_collection
+from app.core.s3_client import generate_presigned_url, s3_client
+from app.core.config import S3_BUCKET_NAME
 from app.services.task_queue import enqueue_graph_processing
 from app.core.auth import get_current_user
 from app.models.users import User, UserPublic
@@ -11,10 +16,31 @@ from app.models.docs import DocFile
 import logging
 from app.core.limiter import limiter
 from app.utils.advanced_memory_tracker import advanced_memory_monitor
-import gc
+from app.services.document_counts import invalidate_tenant_counts
+from app.services.tenant_config import get_tenant_config
+from app.utils.search_normalization import build_search_fields
 
 router = APIRouter()
 
+MAX_FILES_PER_BATCH = 5
+UPLOAD_URL_EXPIRATION_SECONDS = 900  # Validez de las URLs PUT de carga directa (15 minutos)
+UPLOAD_CONTENT_TYPE = "application/pdf"  # Firmado en la URL PUT: S3 rechaza otros Content-Type
+MAX_UPLOAD_SIZE_BYTES = 50 * 1024 * 1024  # Tamaño máximo del PDF en cargas directas (50 MB)
+
+
+class UploadSessionRequest(BaseModel):
+    filenames: List[str]
+
+
+def _safe_filename(filename: str) -> str:
+    """
+    Reduce el nombre enviado por el cliente a un basename seguro para usar en keys de S3:
+    sin directorios (`/` ni `\\`) ni secuencias `..`.
+    """
+    basename = (filename or "").replace("\\", "/").rsplit("/", 1)[-1]
+    basename = basename.replace("..", "").strip()
+    return basename or "documento.pdf"
+
 
 # -------------------------------------------------------------------------------------
 # COMPLETE PROCESS BATCH: Upload, Convert, Recognize y Extract de múltiples archivos
@@ -27,29 +53,38 @@ async def complete_process_batch_task(
     current_user: User = Depends(get_current_user),
     request: Request = None
 ):
-    if len(files) > 5:
-        raise HTTPException(status_code=400, detail="No se pueden subir más de 5 archivos por vez.")
+    if len(files) > MAX_FILES_PER_BATCH:
+        raise HTTPException(status_code=400, detail=f"No se pueden subir más de {MAX_FILES_PER_BATCH} archivos por vez.")
     
     docfile_ids = []
     
     try:
         for file in files:
-            file_content = await file.read()
-            
+            filename = _safe_filename(file.filename)
             # Crea DocFile inmediatamente
             docfile = DocFile(
-                name=file.filename,
+                name=filename,
                 uploaded_by=f"{current_user.first_name} {current_user.last_name}",
                 status="En cola",
                 progress=0
             )
-            docfile_db = await docs_collection.insert_one(docfile.model_dump(by_alias=True))
+            docfile_db = await docs_collection.insert_one({
+                **docfile.model_dump(by_alias=True),
+                **build_search_fields(name=docfile.name, uploaded_by=docfile.uploaded_by),
+            })
             docfile_id = str(docfile_db.inserted_id)
             docfile_ids.append(docfile_id)
+            invalidate_tenant_counts(current_user.tenant_id)
+            
+            # Subir el PDF a S3 en streaming desde el archivo temporal del upload:
+            # el contenido nunca se carga entero en memoria ni viaja por la cola
+            tenant_config = get_tenant_config(current_user.tenant_id)
+            s3_pdf_key = f"{tenant_config.get_s3_prefix(docfile_id)}/pdf_file/{filename}"
+            await asyncio.to_thread(s3_client.upload_fileobj, file.file, S3_BUCKET_NAME, s3_pdf_key)
             
             # Log información detallada para tracking
-            logging.info(f"[BATCH_PROCESS] Encolando archivo: {file.filename} - "
-                        f"DocID: {docfile_id} - Tamaño: {len(file_content)} bytes")
+            logging.info(f"[BATCH_PROCESS] Encolando archivo: {filename} - "
+                        f"DocID: {docfile_id} - S3: {s3_pdf_key}")
             
             # Convertir User a UserPublic para el sistema LangGraph
             requester = UserPublic(**current_user.model_dump())
@@ -59,22 +94,134 @@ async def complete_process_batch_task(
                 operation="complete_process",
                 docfile_id=docfile_id,
                 requester=requester,
-                filename=file.filename,
-                file_content=file_content
+                filename=filename,
+                s3_pdf_key=s3_pdf_key
             )
-            
-            # Liberar memoria inmediatamente después de encolar
-            del file_content
-            gc.collect()
         
         return {"message": "Los documentos están siendo procesados.", "docfile_ids": docfile_ids}
         
     except Exception as e:
         logging.error(f"[BATCH_PROCESS] Error procesando batch: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error procesando archivos: {str(e)}")
-    finally:
-        # Forzar limpieza final
-        gc.collect()
+
+
+# -------------------------------------------------------------------------------------
+# CARGA DIRECTA A S3: el navegador sube el PDF con una URL PUT pre-firmada
+# y luego confirma la carga. El backend nunca recibe los bytes del archivo.
+# -------------------------------------------------------------------------------------
+def _pdf_s3_key(tenant_id: str, docfile_id: str, filename: str) -> str:
+    """Key del PDF original en S3 (mismo formato que usa la carga por batch)."""
+    return f"{get_tenant_config(tenant_id).get_s3_prefix(docfile_id)}/pdf_file/{_safe_filename(filename)}"
+
+
+@router.post("/upload_session", response_model=dict)
+@limiter.limit("3/minute")
+async def create_upload_session(
+    body: UploadSessionRequest,
+    current_user: User = Depends(get_current_user),
+    request: Request = None
+):
+    """
+    Crea un DocFile por archivo y devuelve, para cada uno, una URL PUT pre-firmada
+    para subir el PDF directamente a S3. El PUT debe enviar los headers de `upload_headers`.
+    Hasta confirmar la carga el DocFile queda con `upload_pending` y no aparece en los listados;
+    si nunca se confirma, el índice TTL sobre `pending_since` lo elimina.
+    """
+    if not body.filenames:
+        raise HTTPException(status_code=400, detail="Debe indicar al menos un archivo.")
+    if len(body.filenames) > MAX_FILES_PER_BATCH:
+        raise HTTPException(status_code=400, detail=f"No se pueden subir más de {MAX_FILES_PER_BATCH} archivos por vez.")
+
+    uploads = []
+    pending_since = datetime.now(timezone.utc)
+    for filename in map(_safe_filename, body.filenames):
+        docfile = DocFile(
+            name=filename,
+            uploaded_by=f"{current_user.first_name} {current_user.last_name}",
+            status="En cola",
+            progress=0,
+            tenant_id=current_user.tenant_id
+        )
+        docfile_db = await docs_collection.insert_one({
+            **docfile.model_dump(by_alias=True),
+            **build_search_fields(name=docfile.name, uploaded_by=docfile.uploaded_by),
+            "upload_pending": True,  # Se quita al confirmar la carga
+            "pending_since": pending_since,  # Expira por TTL si la carga se abandona
+        })
+        docfile_id = str(docfile_db.inserted_id)
+
+        s3_pdf_key = _pdf_s3_key(current_user.tenant_id, docfile_id, filename)
+        uploads.append({
+            "docfile_id": docfile_id,
+            "filename": filename,
+            "upload_url": generate_presigned_url(
+                s3_pdf_key, UPLOAD_URL_EXPIRATION_SECONDS, method="PUT", content_type=UPLOAD_CONTENT_TYPE
+            ),
+        })
+
+    logging.info(f"[UPLOAD_SESSION] {len(uploads)} cargas directas creadas para {current_user.username}")
+
+    return {
+        "uploads": uploads,
+        "upload_headers": {"Content-Type": UPLOAD_CONTENT_TYPE},
+        "expires_in": UPLOAD_URL_EXPIRATION_SECONDS,
+    }
+
+
+@router.post("/upload_complete/{docfile_id}", response_model=dict)
+@limiter.limit("15/minute")
+async def complete_direct_upload(
+    docfile_id: str,
+    current_user: User = Depends(get_current_user),
+    request: Request = None
+):
+    """
+    Confirma que el PDF de una carga directa ya está en S3 y encola su procesamiento completo.
+    """
+    if not ObjectId.is_valid(docfile_id):
+        raise HTTPException(status_code=400, detail="ID de documento inválido")
+
+    pending_filter = {
+        "_id": ObjectId(docfile_id),
+        "tenant_id": current_user.tenant_id,
+        "upload_pending": True,
+    }
+    document = await docs_collection.find_one(pending_filter, {"name": 1})
+    if not document:
+        raise HTTPException(status_code=404, detail="Carga pendiente no encontrada")
+
+    s3_pdf_key = _pdf_s3_key(current_user.tenant_id, docfile_id, document["name"])
+    try:
+        head = await asyncio.to_thread(s3_client.head_object, Bucket=S3_BUCKET_NAME, Key=s3_pdf_key)
+    except Exception:
+        raise HTTPException(status_code=400, detail="El archivo todavía no fue subido a S3")
+
+    if head.get("ContentLength", 0) > MAX_UPLOAD_SIZE_BYTES:
+        # Se descarta el objeto: el DocFile sigue pendiente (y oculto) hasta una carga válida
+        await asyncio.to_thread(s3_client.delete_object, Bucket=S3_BUCKET_NAME, Key=s3_pdf_key)
+        raise HTTPException(
+            status_code=400,
+            detail=f"El archivo supera el tamaño máximo de {MAX_UPLOAD_SIZE_BYTES // (1024 * 1024)} MB"
+        )
+
+    # Marcar la carga como confirmada de forma atómica (evita encolar dos veces)
+    result = await docs_collection.update_one(
+        pending_filter, {"$unset": {"upload_pending": "", "pending_since": ""}}
+    )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=409, detail="La carga ya fue confirmada")
+    # Recién ahora el documento pasa a ser visible en /documents
+    invalidate_tenant_counts(current_user.tenant_id)
+
+    await enqueue_graph_processing(
+        operation="complete_process",
+        docfile_id=docfile_id,
+        requester=UserPublic(**current_user.model_dump()),
+        filename=document["name"],
+        s3_pdf_key=s3_pdf_key
+    )
+
+    return {"message": "El documento está siendo procesado.", "docfile_id": docfile_id}
 
 
 # -------------------------------------------------------------------------------------
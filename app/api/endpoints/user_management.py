@@ -1,11 +1,13 @@
 # app/api/endpoints/user_management.py
 
 import logging
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import List, Optional, Tuple
 
 from fastapi import (
     APIRouter,
+    BackgroundTasks,
     Depends,
     Form,
     HTTPException,
@@ -14,19 +16,41 @@ from fastapi import (
     status,
 )
 from bson import ObjectId
+from pymongo import ReturnDocument
 
-from app.core.auth import (
-    get_admin_or_superadmin_user,
-    can_manage_user,
-)
+from app.core.admin_rate_guard import get_rate_guarded_admin_user
+from app.core.auth import can_manage_user, invalidate_cached_user_by_username
 from app.core.database import users_collection
 from app.core.limiter import limiter
-from app.models.users import User, UserPublic
-from app.utils.email_utils import send_welcome_email
+from app.models.users import (
+    USER_PUBLIC_PROJECTION,
+    USER_SUMMARY_PROJECTION,
+    BulkApproveRequest,
+    ManageUserAction,
+    User,
+    UserPublic,
+    UserRole,
+    UserStatus,
+    UserSummary,
+)
+from app.services.user_listings_cache import (
+    get_cached_user_listing,
+    invalidate_user_listings,
+    set_cached_user_listing,
+    user_listing_key,
+)
+from app.utils.email_utils import email_delivery_available, run_email_task, send_welcome_email
+from app.utils.json_response import FastJSONResponse
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Campos que necesita el email de bienvenida al aprobar un usuario
+WELCOME_EMAIL_PROJECTION = {"first_name": 1, "username": 1, "email": 1, "role": 1}
+
+# Usuarios que esperan aprobación (coincide con el índice parcial de migrations.py)
+PENDING_USERS_FILTER = {"status": "pending_approval", "email_verified": True}
+
 
 # ────────────────────────────────────────────────────────────────
 # LISTADO DE USUARIOS PENDIENTES
@@ -34,26 +58,33 @@ logger = logging.getLogger(__name__)
 
 @router.get("/pending-users", response_model=List[UserPublic])
 async def get_pending_users(
-    current_user: User = Depends(get_admin_or_superadmin_user)
+    current_user: User = Depends(get_rate_guarded_admin_user)
 ):
     """
     Lista usuarios pendientes de aprobación.
     Requiere rol admin o superadmin.
     """
     try:
+        cache_key = user_listing_key("pending")
+        cached = await get_cached_user_listing(cache_key)
+        if cached is not None:
+            return FastJSONResponse(content=cached)
+
         # Buscar usuarios con status pending_approval
-        cursor = users_collection.find({
-            "status": "pending_approval",
-            "email_verified": True
-        }).sort("created_at", 1)
+        cursor = users_collection.find(PENDING_USERS_FILTER, USER_PUBLIC_PROJECTION).sort("created_at", 1)
         
-        users = []
-        async for user_data in cursor:
-            users.append(UserPublic(**user_data))
+        # Datos leídos de la BD con la proyección pública: no se vuelven a validar.
+        # Se traen todos en un solo await en lugar de uno por documento.
+        users = [
+            UserPublic.model_construct(**user_data).model_dump(by_alias=True)
+            for user_data in await cursor.to_list(length=None)
+        ]
         
         logger.info(f"Admin {current_user.username} consultó usuarios pendientes: {len(users)} encontrados")
         
-        return users
+        await set_cached_user_listing(cache_key, users)
+        # orjson serializa directo (datetimes nativos, ObjectId a string), sin jsonable_encoder
+        return FastJSONResponse(content=users)
 
     except Exception as e:
         logger.error(f"Error obteniendo usuarios pendientes: {str(e)}")
@@ -63,6 +94,33 @@ async def get_pending_users(
         )
 
 
+@router.get("/pending-users/count", response_model=dict)
+async def get_pending_users_count(
+    current_user: User = Depends(get_rate_guarded_admin_user)
+):
+    """
+    Cantidad de usuarios pendientes, para el badge del panel de admin.
+    Se sirve del cache de listados, que se invalida en cada alta, aprobación o rechazo.
+    """
+    try:
+        cache_key = user_listing_key("pending_count")
+        cached = await get_cached_user_listing(cache_key)
+        if cached is not None:
+            return cached
+
+        # Conteo resuelto con el índice parcial: su tamaño es la cantidad de pendientes
+        response = {"count": await users_collection.count_documents(PENDING_USERS_FILTER)}
+        await set_cached_user_listing(cache_key, response)
+        return response
+
+    except Exception as e:
+        logger.error(f"Error contando usuarios pendientes: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error interno del servidor"
+        )
+
+
 # ────────────────────────────────────────────────────────────────
 # APROBAR USUARIO
 # ────────────────────────────────────────────────────────────────
@@ -70,7 +128,8 @@ async def get_pending_users(
 @router.post("/approve-user/{user_id}", response_model=dict)
 async def approve_user(
     user_id: str,
-    current_user: User = Depends(get_admin_or_superadmin_user)
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_rate_guarded_admin_user)
 ):
     """
     Aprueba un usuario pendiente.
@@ -83,12 +142,21 @@ async def approve_user(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="ID de usuario inválido"
             )
+        user_oid = ObjectId(user_id)
 
-        # Buscar usuario pendiente
-        user_data = await users_collection.find_one({
-            "_id": ObjectId(user_id),
-            "status": "pending_approval"
-        })
+        # Pasar a active solo si sigue pendiente (búsqueda y actualización atómicas)
+        user_data = await users_collection.find_one_and_update(
+            {"_id": user_oid, "status": "pending_approval"},
+            {
+                "$set": {
+                    "status": "active",
+                    "approved_at": datetime.now(timezone.utc),
+                    "approved_by": current_user.username,
+                }
+            },
+            projection=WELCOME_EMAIL_PROJECTION,
+            return_document=ReturnDocument.BEFORE,
+        )
         
         if not user_data:
             raise HTTPException(
@@ -96,29 +164,88 @@ async def approve_user(
                 detail="Usuario pendiente no encontrado"
             )
 
-        # Actualizar status a active
-        await users_collection.update_one(
-            {"_id": ObjectId(user_id)},
+        # Enviar email de bienvenida después de responder (no bloquea al admin con el SMTP)
+        # `email_sent` conserva el nombre de la respuesta original: indica que el envío quedó encolado
+        email_sent = email_delivery_available()
+        if email_sent:
+            background_tasks.add_task(run_email_task, send_welcome_email, user_data)
+        else:
+            logger.warning(f"No se pudo enviar email de bienvenida a {user_data['email']}")
+
+        await invalidate_user_listings()
+        logger.info(f"Usuario {user_data['username']} aprobado por admin {current_user.username}")
+        
+        return {
+            "message": f"Usuario {user_data['username']} aprobado exitosamente",
+            "username": user_data["username"],
+            "email_sent": email_sent
+        }
+
+    except HTTPException:
+        # Re-lanzar HTTPException sin modificar
+        raise
+    except Exception as e:
+        logger.error(f"Error aprobando usuario {user_id}: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error interno del servidor"
+        )
+
+
+@router.post("/approve-users", response_model=dict)
+async def approve_users(
+    payload: BulkApproveRequest,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_rate_guarded_admin_user)
+):
+    """
+    Aprueba varios usuarios pendientes en una sola escritura.
+    Los IDs que no estén pendientes se informan en `not_approved`.
+    """
+    try:
+        if not all(ObjectId.is_valid(user_id) for user_id in payload.user_ids):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="ID de usuario inválido"
+            )
+        user_oids = list({ObjectId(user_id) for user_id in payload.user_ids})
+
+        # Marca única de este lote: identifica a los usuarios aprobados por esta request,
+        # aunque otras aprobaciones concurrentes escriban al mismo tiempo
+        approval_batch = ObjectId()
+
+        await users_collection.update_many(
+            {"_id": {"$in": user_oids}, "status": "pending_approval"},
             {
                 "$set": {
                     "status": "active",
-                    "approved_at": datetime.utcnow(),
+                    "approved_at": datetime.now(timezone.utc),
                     "approved_by": current_user.username,
+                    "approval_batch": approval_batch,
                 }
-            }
+            },
         )
+        approved_users = await users_collection.find(
+            {"_id": {"$in": user_oids}, "approval_batch": approval_batch},
+            WELCOME_EMAIL_PROJECTION,
+        ).to_list(length=None)
 
-        # Enviar email de bienvenida
-        email_sent = await send_welcome_email(user_data)
-        
-        if not email_sent:
-            logger.warning(f"No se pudo enviar email de bienvenida a {user_data['email']}")
+        # Mismo significado que en approve_user: el envío quedó encolado
+        email_sent = email_delivery_available()
+        if email_sent:
+            for user_data in approved_users:
+                background_tasks.add_task(run_email_task, send_welcome_email, user_data)
+
+        if approved_users:
+            await invalidate_user_listings()
+
+        approved_ids = {user_data["_id"] for user_data in approved_users}
+        logger.info(f"{len(approved_users)} usuarios aprobados por admin {current_user.username}")
 
-        logger.info(f"Usuario {user_data['username']} aprobado por admin {current_user.username}")
-        
         return {
-            "message": f"Usuario {user_data['username']} aprobado exitosamente",
-            "username": user_data["username"],
+            "message": f"{len(approved_users)} usuarios aprobados exitosamente",
+            "approved": [user_data["username"] for user_data in approved_users],
+            "not_approved": [str(user_oid) for user_oid in user_oids if user_oid not in approved_ids],
             "email_sent": email_sent
         }
 
@@ -126,7 +253,7 @@ async def approve_user(
         # Re-lanzar HTTPException sin modificar
         raise
     except Exception as e:
-        logger.error(f"Error aprobando usuario {user_id}: {str(e)}")
+        logger.error(f"Error aprobando usuarios en lote: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error interno del servidor"
@@ -141,7 +268,7 @@ async def approve_user(
 async def reject_user(
     user_id: str,
     reason: Optional[str] = Form(None),
-    current_user: User = Depends(get_admin_or_superadmin_user)
+    current_user: User = Depends(get_rate_guarded_admin_user)
 ):
     """
     Rechaza un usuario pendiente.
@@ -154,34 +281,33 @@ async def reject_user(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="ID de usuario inválido"
             )
-
-        # Buscar usuario pendiente
-        user_data = await users_collection.find_one({
-            "_id": ObjectId(user_id),
-            "status": "pending_approval"
-        })
-        
-        if not user_data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Usuario pendiente no encontrado"
-            )
+        user_oid = ObjectId(user_id)
 
         # Actualizar status a rejected
         update_data = {
             "status": "rejected",
-            "rejected_at": datetime.utcnow(),
+            "rejected_at": datetime.now(timezone.utc),
             "rejected_by": current_user.username,
         }
         
         if reason:
             update_data["rejection_reason"] = reason
 
-        await users_collection.update_one(
-            {"_id": ObjectId(user_id)},
-            {"$set": update_data}
+        # Rechazar solo si sigue pendiente (búsqueda y actualización atómicas)
+        user_data = await users_collection.find_one_and_update(
+            {"_id": user_oid, "status": "pending_approval"},
+            {"$set": update_data},
+            projection={"username": 1},
         )
+        
+        if not user_data:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Usuario pendiente no encontrado"
+            )
 
+        await invalidate_cached_user_by_username(user_data["username"])
+        await invalidate_user_listings()
         logger.info(f"Usuario {user_data['username']} rechazado por admin {current_user.username}")
         
         return {
@@ -205,15 +331,35 @@ async def reject_user(
 # LISTADO DE USUARIOS REGISTRADOS
 # ────────────────────────────────────────────────────────────────
 
+@lru_cache(maxsize=None)
+def _visible_users_base_query(role: str) -> Tuple[Tuple[str, dict], ...]:
+    """Filtro base de /users según el rol del admin (uno por rol, armado una sola vez)."""
+    # Excluir usuarios eliminados (soft delete)
+    base_query = (("status", {"$ne": "deleted"}),)
+    if role == "admin":
+        # Admin solo ve users y otros admin (no superadmin)
+        base_query += (("role", {"$in": ["user", "admin"]}),)
+    # Superadmin puede ver todos los usuarios (incluyendo otros superadmin)
+    return base_query
+
+
+async def get_visible_users_query(
+    current_user: User = Depends(get_rate_guarded_admin_user)
+) -> dict:
+    """Copia del filtro base: los filtros del request reemplazan claves, no mutan los valores cacheados."""
+    return dict(_visible_users_base_query(current_user.role))
+
+
 @router.get("/users", response_model=dict)
 @limiter.limit("20/minute")
 async def get_registered_users(
     request: Request,
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
-    status_filter: Optional[str] = Query(None, alias="status"),
-    role_filter: Optional[str] = Query(None, alias="role"),
-    current_user: User = Depends(get_admin_or_superadmin_user)
+    status_filter: Optional[UserStatus] = Query(None, alias="status"),
+    role_filter: Optional[UserRole] = Query(None, alias="role"),
+    query: dict = Depends(get_visible_users_query),
+    current_user: User = Depends(get_rate_guarded_admin_user)
 ):
     """
     Lista usuarios registrados con paginación y filtros.
@@ -221,18 +367,7 @@ async def get_registered_users(
     Superadmin ve todos los usuarios incluyendo otros superadmin.
     """
     try:
-        # Construir filtros de búsqueda
-        query = {}
-        
-        # Excluir usuarios eliminados (soft delete)
-        query["status"] = {"$ne": "deleted"}
-        
-        # Filtros de visibilidad por rol
-        if current_user.role == "admin":
-            # Admin solo ve users y otros admin (no superadmin)
-            query["role"] = {"$in": ["user", "admin"]}
-        # Superadmin puede ver todos los usuarios (incluyendo otros superadmin)
-        # No se aplica filtro de rol para superadmin
+        # `query` ya trae el filtro de visibilidad por rol (get_visible_users_query)
 
         # Filtro por status
         if status_filter:
@@ -248,26 +383,40 @@ async def get_registered_users(
                 )
             query["role"] = role_filter
 
-        # Contar total de usuarios
-        total_users = await users_collection.count_documents(query)
-        
+        # La visibilidad depende del rol del admin: forma parte de la clave del cache
+        cache_key = user_listing_key("users", current_user.role, status_filter, role_filter, page, limit)
+        cached = await get_cached_user_listing(cache_key)
+        if cached is not None:
+            return FastJSONResponse(content=cached)
+
         # Calcular paginación
         skip = (page - 1) * limit
-        total_pages = (total_users + limit - 1) // limit
 
-        # Obtener usuarios paginados
-        cursor = users_collection.find(query)\
-            .sort("created_at", -1)\
-            .skip(skip)\
-            .limit(limit)
+        # Página y total en una sola agregación (un round-trip, un único recorrido del índice)
+        pipeline = [
+            {"$match": query},
+            {
+                "$facet": {
+                    "data": [
+                        {"$sort": {"created_at": -1}},
+                        {"$skip": skip},
+                        {"$limit": limit},
+                        {"$project": USER_PUBLIC_PROJECTION},
+                    ],
+                    "total": [{"$count": "n"}],
+                }
+            },
+        ]
+        result = (await users_collection.aggregate(pipeline).to_list(length=1))[0]
+        total_users = result["total"][0]["n"] if result["total"] else 0
+        total_pages = (total_users + limit - 1) // limit
         
-        users = []
-        async for user_data in cursor:
-            users.append(UserPublic(**user_data))
+        # Datos leídos de la BD con la proyección pública: no se vuelven a validar
+        users = [UserPublic.model_construct(**user_data).model_dump(by_alias=True) for user_data in result["data"]]
 
         logger.info(f"Admin {current_user.username} consultó usuarios registrados: página {page}")
         
-        return {
+        response = {
             "users": users,
             "pagination": {
                 "current_page": page,
@@ -282,6 +431,8 @@ async def get_registered_users(
                 "role": role_filter
             }
         }
+        await set_cached_user_listing(cache_key, response)
+        return FastJSONResponse(content=response)
 
     except Exception as e:
         logger.error(f"Error obteniendo usuarios registrados: {str(e)}")
@@ -295,14 +446,101 @@ async def get_registered_users(
 # GESTIONAR USUARIO
 # ────────────────────────────────────────────────────────────────
 
+# Cada acción valida el estado del usuario objetivo y devuelve (campos a actualizar, descripción).
+# `now` se toma una sola vez por request para todos los campos *_at.
+
+def _deactivate_user(target_user: UserSummary, current_user: User, new_role: Optional[UserRole], now: datetime) -> Tuple[dict, str]:
+    if target_user.status == "inactive":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El usuario ya está desactivado"
+        )
+    update_data = {
+        "status": "inactive",
+        "deactivated_by": current_user.username,
+        "deactivated_at": now,
+    }
+    return update_data, "desactivado"
+
+
+def _activate_user(target_user: UserSummary, current_user: User, new_role: Optional[UserRole], now: datetime) -> Tuple[dict, str]:
+    if target_user.status == "active":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El usuario ya está activo"
+        )
+    update_data = {
+        "status": "active",
+        "deactivated_by": None,
+        "deactivated_at": None,
+    }
+    return update_data, "activado"
+
+
+def _change_user_role(target_user: UserSummary, current_user: User, new_role: Optional[UserRole], now: datetime) -> Tuple[dict, str]:
+    if not new_role:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Se requiere especificar el nuevo rol"
+        )
+
+    valid_roles = ["user", "admin"]
+    if current_user.role == "admin" and new_role not in ["user"]:
+        # Admin solo puede cambiar a user
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo puedes asignar el rol 'user'"
+        )
+    elif current_user.role == "superadmin" and new_role not in valid_roles:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Rol inválido. Debe ser uno de: {', '.join(valid_roles)}"
+        )
+
+    if target_user.role == new_role:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El usuario ya tiene el rol '{new_role}'"
+        )
+
+    update_data = {
+        "role": new_role,
+        "role_changed_by": current_user.username,
+        "role_changed_at": now,
+    }
+    return update_data, f"rol cambiado de '{target_user.role}' a '{new_role}'"
+
+
+def _delete_user(target_user: UserSummary, current_user: User, new_role: Optional[UserRole], now: datetime) -> Tuple[dict, str]:
+    if target_user.status == "deleted":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El usuario ya está eliminado"
+        )
+    update_data = {
+        "status": "deleted",
+        "deleted_by": current_user.username,
+        "deleted_at": now,
+    }
+    return update_data, "eliminado"
+
+
+MANAGE_USER_ACTIONS = {
+    "deactivate": _deactivate_user,
+    "activate": _activate_user,
+    "change_role": _change_user_role,
+    "delete": _delete_user,
+}
+
+
 @router.put("/manage-user/{user_id}", response_model=dict)
 @limiter.limit("10/minute")
 async def manage_user(
     request: Request,
     user_id: str,
-    action: str = Form(...),  # "deactivate" | "activate" | "change_role" | "delete"
-    new_role: Optional[str] = Form(None),  # Solo para change_role
-    current_user: User = Depends(get_admin_or_superadmin_user)
+    action: ManageUserAction = Form(...),  # FastAPI rechaza acciones inválidas con 422
+    new_role: Optional[UserRole] = Form(None),  # Solo para change_role
+    current_user: User = Depends(get_rate_guarded_admin_user)
 ):
     """
     Gestiona usuarios: activar, desactivar, cambiar rol, eliminar.
@@ -315,17 +553,10 @@ async def manage_user(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="ID de usuario inválido"
             )
-
-        # Validar acción
-        valid_actions = ["deactivate", "activate", "change_role", "delete"]
-        if action not in valid_actions:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Acción inválida. Debe ser una de: {', '.join(valid_actions)}"
-            )
+        user_oid = ObjectId(user_id)
 
         # Buscar usuario objetivo
-        target_user_data = await users_collection.find_one({"_id": ObjectId(user_id)})
+        target_user_data = await users_collection.find_one({"_id": user_oid}, USER_SUMMARY_PROJECTION)
         
         if not target_user_data:
             raise HTTPException(
@@ -333,7 +564,8 @@ async def manage_user(
                 detail="Usuario no encontrado"
             )
 
-        target_user = User(**target_user_data)
+        # Solo se leen username, role y status: no se valida el documento completo
+        target_user = UserSummary.model_construct(**target_user_data)
 
         # Verificar permisos para gestionar este usuario
         if not can_manage_user(current_user, target_user):
@@ -343,87 +575,25 @@ async def manage_user(
             )
 
         # Ejecutar acción
-        update_data = {}
-        action_description = ""
-
-        if action == "deactivate":
-            if target_user.status == "inactive":
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="El usuario ya está desactivado"
-                )
-            update_data = {
-                "status": "inactive",
-                "deactivated_by": current_user.username,
-                "deactivated_at": datetime.utcnow(),
-            }
-            action_description = "desactivado"
-
-        elif action == "activate":
-            if target_user.status == "active":
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="El usuario ya está activo"
-                )
-            update_data = {
-                "status": "active",
-                "deactivated_by": None,
-                "deactivated_at": None,
-            }
-            action_description = "activado"
-
-        elif action == "change_role":
-            if not new_role:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Se requiere especificar el nuevo rol"
-                )
-            
-            valid_roles = ["user", "admin"]
-            if current_user.role == "admin" and new_role not in ["user"]:
-                # Admin solo puede cambiar a user
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="Solo puedes asignar el rol 'user'"
-                )
-            elif current_user.role == "superadmin" and new_role not in valid_roles:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Rol inválido. Debe ser uno de: {', '.join(valid_roles)}"
-                )
-
-            if target_user.role == new_role:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"El usuario ya tiene el rol '{new_role}'"
-                )
-
-            update_data = {
-                "role": new_role,
-                "role_changed_by": current_user.username,
-                "role_changed_at": datetime.utcnow(),
-            }
-            action_description = f"rol cambiado de '{target_user.role}' a '{new_role}'"
-
-        elif action == "delete":
-            if target_user.status == "deleted":
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="El usuario ya está eliminado"
-                )
-            update_data = {
-                "status": "deleted",
-                "deleted_by": current_user.username,
-                "deleted_at": datetime.utcnow(),
-            }
-            action_description = "eliminado"
+        update_data, action_description = MANAGE_USER_ACTIONS[action](
+            target_user, current_user, new_role, datetime.now(timezone.utc)
+        )
 
-        # Actualizar usuario
-        await users_collection.update_one(
-            {"_id": ObjectId(user_id)},
+        # Actualizar usuario solo si no cambió desde que se verificaron los permisos
+        result = await users_collection.update_one(
+            {"_id": user_oid, "status": target_user.status, "role": target_user.role},
             {"$set": update_data}
         )
+        if result.matched_count == 0:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="El usuario fue modificado por otra operación. Intenta nuevamente."
+            )
 
+        # Las sesiones del usuario se descartan ya: desactivar, eliminar o cambiar el rol
+        # no debe esperar al TTL del cache del usuario actual
+        await invalidate_cached_user_by_username(target_user.username)
+        await invalidate_user_listings()
         logger.info(f"Usuario {target_user.username} {action_description} por admin {current_user.username}")
         
         return {
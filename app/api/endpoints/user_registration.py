@@ -1,22 +1,27 @@
 # app/api/endpoints/user_registration.py
 
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 
+from cachetools import TTLCache
 from fastapi import (
     APIRouter,
+    BackgroundTasks,
     Depends,
     HTTPException,
     Request,
     status,
 )
 from pydantic import ValidationError
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 from app.core.auth import (
     get_current_user,
-    hash_password,
-    verify_password,
+    hash_password_async,
+    invalidate_cached_user,
+    verify_current_password,
     validate_password_strength,
 )
 from app.core.database import users_collection
@@ -31,7 +36,11 @@ from app.models.users import (
     ForgotPasswordRequest,
     ResetPasswordRequest,
 )
+from app.services.tenant_mapping import get_tenant_id_from_email
+from app.services.user_listings_cache import invalidate_user_listings
 from app.utils.email_utils import (
+    email_delivery_available,
+    run_email_task,
     send_verification_email,
     send_admin_notification_email,
     send_password_reset_email,
@@ -57,6 +66,7 @@ logger = logging.getLogger(__name__)
 async def register_user(
     request: Request,
     user_data: UserRegistrationRequest,
+    background_tasks: BackgroundTasks,
 ):
     """
     Registro de nuevo usuario con verificación de email.
@@ -77,34 +87,25 @@ async def register_user(
                 detail="La contraseña debe tener al menos 8 caracteres, incluir mayúsculas, minúsculas y números"
             )
 
-        # ¿Ya existe username o email?
-        existing_user = await users_collection.find_one(
-            {"$or": [{"username": user_data.username}, {"email": user_data.email}]}
-        )
-        if existing_user:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="El usuario o correo ya están registrados",
-            )
-
         # Generar token de verificación
         verification_token = generate_token()
         token_expiration = get_token_expiration()
 
         # Obtener tenant_id basado en el dominio del email
-        from app.services.tenant_mapping import get_tenant_id_from_email
         tenant_id = get_tenant_id_from_email(user_data.email)
 
         # Crear nuevo usuario
         new_user = {
             "username": user_data.username,
+            "username_lower": user_data.username.lower(),
             "email": user_data.email,
-            "password_hash": hash_password(user_data.password),
+            "email_lower": user_data.email.lower(),
+            "password_hash": await hash_password_async(user_data.password),
             "first_name": user_data.first_name,
             "last_name": user_data.last_name,
             "role": "user",
             "status": "email_pending",  # Esperando verificación de email
-            "created_at": datetime.utcnow(),
+            "created_at": datetime.now(timezone.utc),
             "company_domain": extract_company_domain(user_data.email),
             "email_verified": False,
             "email_verification_token": verification_token,
@@ -112,12 +113,23 @@ async def register_user(
             "tenant_id": tenant_id,  # Asignar tenant basado en dominio
         }
 
-        result = await users_collection.insert_one(new_user)
-        
-        # Enviar email de verificación
-        email_sent = await send_verification_email(new_user, verification_token)
+        # Los índices únicos de username_lower y email_lower detectan duplicados
+        # en la misma escritura (sin consulta previa ni carrera entre registros)
+        try:
+            await users_collection.insert_one(new_user)
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="El usuario o correo ya están registrados",
+            )
+        await invalidate_user_listings()
         
-        if not email_sent:
+        # Enviar email de verificación después de responder.
+        # `email_sent` (nombre original de la respuesta) indica que el envío quedó encolado
+        email_sent = email_delivery_available()
+        if email_sent:
+            background_tasks.add_task(run_email_task, send_verification_email, new_user, verification_token)
+        else:
             logger.warning(f"No se pudo enviar email de verificación a {user_data.email}")
 
         logger.info(f"Usuario registrado: {user_data.username} ({user_data.email})")
@@ -148,38 +160,33 @@ async def register_user(
 # VERIFICACIÓN DE EMAIL
 # ────────────────────────────────────────────────────────────────
 
+# Lo que usan la verificación y el email de notificación a administradores
+VERIFY_EMAIL_PROJECTION = {
+    "email_verification_expires": 1,
+    "email_verified": 1,
+    "username": 1,
+    "first_name": 1,
+    "last_name": 1,
+    "email": 1,
+    "company_domain": 1,
+    "created_at": 1,
+}
+
 @router.get("/verify-email/{token}", response_model=dict)
-async def verify_email(token: str):
+async def verify_email(token: str, background_tasks: BackgroundTasks):
     """
     Verifica el email del usuario usando el token enviado por correo.
     Cambia el status de email_pending -> pending_approval.
     """
     try:
-        # Buscar usuario por token
-        user_data = await users_collection.find_one({
-            "email_verification_token": token
-        })
-        
-        if not user_data:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Token de verificación inválido"
-            )
-
-        # Verificar si el token ha expirado
-        if is_token_expired(user_data["email_verification_expires"]):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="El token de verificación ha expirado"
-            )
-
-        # Verificar si ya está verificado
-        if user_data["email_verified"]:
-            return {"message": "El email ya ha sido verificado"}
-
-        # Actualizar usuario
-        await users_collection.update_one(
-            {"_id": user_data["_id"]},
+        # Validar y consumir el token en una sola operación atómica:
+        # la expiración se filtra en la consulta y el token se elimina al usarlo
+        user_data = await users_collection.find_one_and_update(
+            {
+                "email_verification_token": token,
+                "email_verification_expires": {"$gt": datetime.now(timezone.utc)},
+                "email_verified": False,
+            },
             {
                 "$set": {
                     "email_verified": True,
@@ -189,13 +196,36 @@ async def verify_email(token: str):
                     "email_verification_token": "",
                     "email_verification_expires": "",
                 }
-            }
+            },
+            projection=VERIFY_EMAIL_PROJECTION,
+            return_document=ReturnDocument.BEFORE,
         )
 
-        # Notificar a administradores
-        notification_sent = await send_admin_notification_email(user_data)
-        
-        if not notification_sent:
+        if not user_data:
+            # Solo en el camino de error: distinguir token inexistente, expirado o ya usado
+            token_data = await users_collection.find_one(
+                {"email_verification_token": token},
+                {"email_verification_expires": 1, "email_verified": 1},
+            )
+            if not token_data:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Token de verificación inválido"
+                )
+            if is_token_expired(token_data["email_verification_expires"]):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="El token de verificación ha expirado"
+                )
+            return {"message": "El email ya ha sido verificado"}
+
+        await invalidate_user_listings()
+
+        # Notificar a administradores después de responder
+        notification_sent = email_delivery_available()
+        if notification_sent:
+            background_tasks.add_task(run_email_task, send_admin_notification_email, user_data)
+        else:
             logger.warning(f"No se pudo enviar notificación de admin para usuario {user_data['username']}")
 
         logger.info(f"Email verificado para usuario: {user_data['username']}")
@@ -220,11 +250,19 @@ async def verify_email(token: str):
 # ACTUALIZACIÓN DE PERFIL
 # ────────────────────────────────────────────────────────────────
 
+# Campos editables del perfil y su etiqueta en el email de notificación
+EDITABLE_PROFILE_FIELDS = (
+    ("first_name", "Nombre"),
+    ("last_name", "Apellido"),
+    ("username", "Usuario"),
+)
+
 @router.put("/update-profile", response_model=dict)
 @limiter.limit("10/hour")
 async def update_profile(
     request: Request,
     update_data: UserUpdateRequest,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -233,7 +271,7 @@ async def update_profile(
     """
     try:
         # Verificar contraseña actual
-        if not verify_password(update_data.current_password, current_user.password_hash):
+        if not await verify_current_password(current_user, update_data.current_password):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Contraseña actual incorrecta"
@@ -243,40 +281,44 @@ async def update_profile(
         update_fields = {}
         changes = []
 
-        if update_data.first_name and update_data.first_name != current_user.first_name:
-            update_fields["first_name"] = update_data.first_name
-            changes.append(f"Nombre: {current_user.first_name} → {update_data.first_name}")
+        for field, label in EDITABLE_PROFILE_FIELDS:
+            new_value = getattr(update_data, field)
+            old_value = getattr(current_user, field)
+            if new_value and new_value != old_value:
+                update_fields[field] = new_value
+                changes.append(f"{label}: {old_value} → {new_value}")
 
-        if update_data.last_name and update_data.last_name != current_user.last_name:
-            update_fields["last_name"] = update_data.last_name
-            changes.append(f"Apellido: {current_user.last_name} → {update_data.last_name}")
-
-        if update_data.username and update_data.username != current_user.username:
-            # Verificar que el nuevo username no exista
-            existing_user = await users_collection.find_one({"username": update_data.username})
-            if existing_user:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="El nombre de usuario ya está en uso"
-                )
-            update_fields["username"] = update_data.username
-            changes.append(f"Usuario: {current_user.username} → {update_data.username}")
+        if "username" in update_fields:
+            # Un username ya en uso lo rechaza el índice único de username_lower al actualizar
+            # (el propio usuario puede cambiar mayúsculas/minúsculas: es el mismo documento)
+            update_fields["username_lower"] = update_fields["username"].lower()
 
         if not update_fields:
             return {"message": "No se detectaron cambios en el perfil"}
 
         # Actualizar en la base de datos
-        await users_collection.update_one(
-            {"_id": current_user.id},
-            {"$set": update_fields}
-        )
+        try:
+            await users_collection.update_one(
+                {"_id": current_user.id},
+                {"$set": update_fields}
+            )
+        except DuplicateKeyError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="El nombre de usuario ya está en uso"
+            )
+        await invalidate_cached_user(request.cookies.get("token"))
+        await invalidate_user_listings()
 
-        # Enviar email de notificación
-        user_dict = current_user.model_dump()
-        user_dict.update(update_fields)
-        email_sent = await send_profile_update_email(user_dict, changes)
-        
-        if not email_sent:
+        # Enviar email de notificación (solo los campos que usa la plantilla, con el nombre ya actualizado)
+        user_dict = {
+            "first_name": update_fields.get("first_name", current_user.first_name),
+            "email": current_user.email,
+        }
+        email_sent = email_delivery_available()
+        if email_sent:
+            background_tasks.add_task(run_email_task, send_profile_update_email, user_dict, changes)
+        else:
             logger.warning(f"No se pudo enviar email de actualización de perfil a {current_user.email}")
 
         logger.info(f"Perfil actualizado para usuario: {current_user.username}")
@@ -307,6 +349,7 @@ async def update_profile(
 async def change_password(
     request: Request,
     password_data: PasswordChangeRequest,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -314,7 +357,7 @@ async def change_password(
     """
     try:
         # Verificar contraseña actual
-        if not verify_password(password_data.current_password, current_user.password_hash):
+        if not await verify_current_password(current_user, password_data.current_password):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Contraseña actual incorrecta"
@@ -335,22 +378,24 @@ async def change_password(
             )
 
         # Actualizar contraseña
-        new_password_hash = hash_password(password_data.new_password)
+        new_password_hash = await hash_password_async(password_data.new_password)
         await users_collection.update_one(
             {"_id": current_user.id},
             {
                 "$set": {
                     "password_hash": new_password_hash,
-                    "last_password_change": datetime.utcnow(),
+                    "last_password_change": datetime.now(timezone.utc),
                 }
             }
         )
+        await invalidate_cached_user(request.cookies.get("token"))
 
-        # Enviar email de confirmación
-        user_dict = current_user.model_dump()
-        email_sent = await send_password_changed_email(user_dict)
-        
-        if not email_sent:
+        # Enviar email de confirmación (solo los campos que usa la plantilla)
+        user_dict = {"first_name": current_user.first_name, "email": current_user.email}
+        email_sent = email_delivery_available()
+        if email_sent:
+            background_tasks.add_task(run_email_task, send_password_changed_email, user_dict)
+        else:
             logger.warning(f"No se pudo enviar email de confirmación de cambio de contraseña a {current_user.email}")
 
         logger.info(f"Contraseña cambiada para usuario: {current_user.username}")
@@ -375,11 +420,20 @@ async def change_password(
 # RECUPERACIÓN DE CONTRASEÑA
 # ────────────────────────────────────────────────────────────────
 
+# Emails con una solicitud reciente: las ráfagas dentro de la ventana (dobles clics,
+# escaneos) responden el mensaje genérico sin consultar Mongo ni generar otro token.
+# Ventana corta: un usuario que pide reenviar el email a los pocos segundos sí lo recibe.
+FORGOT_PASSWORD_DEDUP_SECONDS = 5
+_recent_forgot_password_emails = TTLCache(maxsize=10_000, ttl=FORGOT_PASSWORD_DEDUP_SECONDS)
+FORGOT_PASSWORD_MESSAGE = "Si el email existe en nuestro sistema, recibirás instrucciones para restablecer tu contraseña."
+
+
 @router.post("/forgot-password", response_model=dict)
 @limiter.limit("10/hour")
 async def forgot_password(
     request: Request,
-    forgot_data: ForgotPasswordRequest
+    forgot_data: ForgotPasswordRequest,
+    background_tasks: BackgroundTasks,
 ):
     """
     Inicia el proceso de recuperación de contraseña.
@@ -389,27 +443,31 @@ async def forgot_password(
     email_normalized = forgot_data.email.lower().strip()
     
     logger.info(f"Solicitud de restablecimiento de contraseña recibida para el correo electrónico: {email_normalized}")
+
+    # Se marca antes de consultar: una ráfaga concurrente del mismo email hace una sola lectura
+    if email_normalized in _recent_forgot_password_emails:
+        logger.info(f"Solicitud repetida de restablecimiento ignorada para: {email_normalized}")
+        return {"message": FORGOT_PASSWORD_MESSAGE}
+    _recent_forgot_password_emails[email_normalized] = True
+
     try:
-        # Buscar usuario por email (case insensitive)
-        user_data = await users_collection.find_one({
-            "email": {"$regex": f"^{email_normalized}$", "$options": "i"}
-        })
+        # Buscar usuario por email (case insensitive, igualdad indexada sobre email_lower)
+        user_data = await users_collection.find_one(
+            {"email_lower": email_normalized},
+            {"status": 1, "first_name": 1, "email": 1},
+        )
         
         # Siempre retornar el mismo mensaje por seguridad
         if not user_data:
             logger.info(f"No se encontró ninguna cuenta asociada al correo electrónico: {email_normalized}")
-            return {
-                "message": "Si el email existe en nuestro sistema, recibirás instrucciones para restablecer tu contraseña."
-            }
+            return {"message": FORGOT_PASSWORD_MESSAGE}
 
         logger.info(f"Usuario encontrado para el correo electrónico: {email_normalized}")
 
         # Solo enviar si el usuario está activo
         if user_data.get("status") != "active":
             logger.info(f"La cuenta asociada al correo electrónico {email_normalized} no está activa.")
-            return {
-                "message": "Si el email existe en nuestro sistema, recibirás instrucciones para restablecer tu contraseña."
-            }
+            return {"message": FORGOT_PASSWORD_MESSAGE}
 
         # Generar token de reset
         reset_token = generate_token()
@@ -426,40 +484,39 @@ async def forgot_password(
             }
         )
 
-        # Enviar email de reset
-        email_sent = await send_password_reset_email(user_data, reset_token)
-        
-        if not email_sent:
-            logger.warning(f"No se pudo enviar email de reset de contraseña a {email_normalized}")
+        # Enviar email de reset después de responder (mismo tiempo de respuesta exista o no el email)
+        if email_delivery_available():
+            background_tasks.add_task(run_email_task, send_password_reset_email, user_data, reset_token)
+            logger.info(f"Correo electrónico de restablecimiento de contraseña encolado para: {email_normalized}")
         else:
-            logger.info(f"Correo electrónico de restablecimiento de contraseña enviado a: {email_normalized}")
+            logger.warning(f"No se pudo enviar email de reset de contraseña a {email_normalized}")
 
         logger.info(f"Reset de contraseña solicitado para: {email_normalized}")
         
-        return {
-            "message": "Si el email existe en nuestro sistema, recibirás instrucciones para restablecer tu contraseña."
-        }
+        return {"message": FORGOT_PASSWORD_MESSAGE}
 
     except Exception as e:
         logger.error(f"Error en reset de contraseña para email {email_normalized}: {str(e)}")
+        # La solicitud no llegó a guardar el token: se permite reintentar de inmediato
+        _recent_forgot_password_emails.pop(email_normalized, None)
         # Siempre retornar el mismo mensaje
-        return {
-            "message": "Si el email existe en nuestro sistema, recibirás instrucciones para restablecer tu contraseña."
-        }
+        return {"message": FORGOT_PASSWORD_MESSAGE}
 
 @router.post("/reset-password/{token}", response_model=dict)
 async def reset_password(
     token: str,
-    reset_data: ResetPasswordRequest
+    reset_data: ResetPasswordRequest,
+    background_tasks: BackgroundTasks,
 ):
     """
     Restablece la contraseña usando el token enviado por email.
     """
     try:
         # Buscar usuario por token
-        user_data = await users_collection.find_one({
-            "password_reset_token": token
-        })
+        user_data = await users_collection.find_one(
+            {"password_reset_token": token},
+            {"password_reset_expires": 1, "username": 1, "first_name": 1, "email": 1},
+        )
         
         if not user_data:
             raise HTTPException(
@@ -488,14 +545,15 @@ async def reset_password(
                 detail="La contraseña debe tener al menos 8 caracteres, incluir mayúsculas, minúsculas y números"
             )
 
-        # Actualizar contraseña y limpiar token
-        new_password_hash = hash_password(reset_data.new_password)
-        await users_collection.update_one(
-            {"_id": user_data["_id"]},
+        # Actualizar contraseña y consumir el token: si otra solicitud lo usó
+        # mientras se calculaba el hash, el filtro no coincide
+        new_password_hash = await hash_password_async(reset_data.new_password)
+        result = await users_collection.update_one(
+            {"_id": user_data["_id"], "password_reset_token": token},
             {
                 "$set": {
                     "password_hash": new_password_hash,
-                    "last_password_change": datetime.utcnow(),
+                    "last_password_change": datetime.now(timezone.utc),
                 },
                 "$unset": {
                     "password_reset_token": "",
@@ -503,11 +561,17 @@ async def reset_password(
                 }
             }
         )
+        if result.matched_count == 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Token de reset inválido"
+            )
 
         # Enviar email de confirmación
-        email_sent = await send_password_changed_email(user_data)
-        
-        if not email_sent:
+        email_sent = email_delivery_available()
+        if email_sent:
+            background_tasks.add_task(run_email_task, send_password_changed_email, user_data)
+        else:
             logger.warning(f"No se pudo enviar email de confirmación de reset a {user_data['email']}")
 
         logger.info(f"Contraseña restablecida para usuario: {user_data['username']}")
@@ -1,24 +1,67 @@
 # path: app/api/endpoints/websocket.py
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, status
-import jwt
 from jwt import ExpiredSignatureError, PyJWTError
-from app.core.config import SECRET_KEY_AUTH, ALGORITHM
+from redis.exceptions import RedisError
+from app.core.auth import decode_access_token
 from app.core.database import users_collection
-from app.models.users import User
+from app.core.redis_client import redis_client
+from app.utils.bucket_rate_limit import BucketTimeRateLimit
 from app.websockets.manager import manager
+import logging
+import secrets
 import time
 
-# Diccionario simple en memoria para rate limiting de handshakes por IP
+logger = logging.getLogger(__name__)
+
+# Rate limiting de handshakes por IP.
+# Con Redis: ventana deslizante compartida entre workers (sorted set por IP).
+# Sin Redis (o si no responde): buckets de 10 segundos en memoria del worker
+# (las IPs inactivas se descartan solas).
 WS_RATE_LIMIT = 10  # conexiones por 60 segundos
 WS_RATE_WINDOW = 60  # segundos
-ws_conn_attempts = {}  # {ip: [timestamps]}
+WS_RATE_BUCKET_SECONDS = 10
+ws_conn_buckets = BucketTimeRateLimit(
+    WS_RATE_BUCKET_SECONDS, WS_RATE_WINDOW // WS_RATE_BUCKET_SECONDS, WS_RATE_LIMIT
+)
+
+# Limpieza de la ventana, conteo y registro del intento en una sola operación atómica.
+# Devuelve 1 si el intento se acepta, 0 si se superó el límite.
+WS_RATE_LIMIT_SCRIPT = (
+    "redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, ARGV[1] - ARGV[2]); "
+    "if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then return 0 end; "
+    "redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4]); "
+    "redis.call('EXPIRE', KEYS[1], ARGV[2]); "
+    "return 1"
+)
+# register_script usa EVALSHA (y carga el script si Redis no lo tiene)
+_ws_rate_limit_script = redis_client.register_script(WS_RATE_LIMIT_SCRIPT) if redis_client else None
 
 MAX_WS_MESSAGES = 1000  # máximo de mensajes por conexión
 MESSAGE_WINDOW_SECONDS = 3600  # ventana de 1 hora
+# Token bucket: capacidad MAX_WS_MESSAGES, se recarga a este ritmo (mensajes por segundo)
+MESSAGE_REFILL_PER_SECOND = MAX_WS_MESSAGES / MESSAGE_WINDOW_SECONDS
 
 router = APIRouter()
 
+
+async def allow_ws_handshake(client_ip: str) -> bool:
+    """Registra un intento de handshake y devuelve False si la IP superó el límite."""
+    if _ws_rate_limit_script:
+        now = time.time()
+        try:
+            allowed = await _ws_rate_limit_script(
+                keys=[f"ws_conn:{client_ip}"],
+                # Miembro único: dos intentos en el mismo instante cuentan por separado
+                args=[now, WS_RATE_WINDOW, WS_RATE_LIMIT, f"{now}:{secrets.token_hex(4)}"],
+            )
+            return bool(allowed)
+        except RedisError as e:
+            logger.error(f"[WS] Error en rate limit de Redis, se usa el límite en memoria: {str(e)}")
+
+    return ws_conn_buckets.hit(client_ip)
+
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """
@@ -27,16 +70,9 @@ async def websocket_endpoint(websocket: WebSocket):
     Aplica rate limiting por IP para el handshake.
     """
     # Rate limiting handshake por IP
-    client_ip = websocket.client.host
-    now = time.time()
-    attempts = ws_conn_attempts.get(client_ip, [])
-    # Filtra intentos fuera de la ventana
-    attempts = [t for t in attempts if now - t < WS_RATE_WINDOW]
-    if len(attempts) >= WS_RATE_LIMIT:
+    if not await allow_ws_handshake(websocket.client.host):
         await websocket.close(code=1013)  # Try again later
         return
-    attempts.append(now)
-    ws_conn_attempts[client_ip] = attempts
 
     # Extraemos la cookie antes de aceptar la conexión
     token = websocket.cookies.get("token")
@@ -47,7 +83,7 @@ async def websocket_endpoint(websocket: WebSocket):
 
     # Validamos y decodificamos el JWT
     try:
-        payload = jwt.decode(token, SECRET_KEY_AUTH, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         username: str = payload.get("sub")
         if not username:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
@@ -60,32 +96,33 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.close(code=1008)
         return
 
-    # Buscamos al usuario en la base de datos
-    user_data = await users_collection.find_one({"username": username})
+    # Buscamos al usuario en la base de datos (solo hace falta su id)
+    user_data = await users_collection.find_one({"username": username}, {"_id": 1})
     if not user_data:
         await websocket.close(code=1008)
         return
 
-    user = User(**user_data)
-    user_id = str(user.id)  # Convertir ObjectId a string para usar como key
+    user_id = str(user_data["_id"])  # Convertir ObjectId a string para usar como key
 
     # Aceptamos la conexión y registramos al usuario
     await websocket.accept()
     await manager.connect(websocket, user_id)
 
-    # --- Límite de mensajes por conexión ---
-    msg_timestamps = []
+    # --- Límite de mensajes por conexión (token bucket: dos floats, O(1) por mensaje) ---
+    msg_tokens = float(MAX_WS_MESSAGES)
+    last_refill = time.monotonic()
     try:
         # Mantenemos vivo el WebSocket
         while True:
             # Limita la cantidad de mensajes por ventana de tiempo
-            now = time.time()
-            msg_timestamps = [t for t in msg_timestamps if now - t < MESSAGE_WINDOW_SECONDS]
-            if len(msg_timestamps) >= MAX_WS_MESSAGES:
+            now = time.monotonic()
+            msg_tokens = min(MAX_WS_MESSAGES, msg_tokens + (now - last_refill) * MESSAGE_REFILL_PER_SECOND)
+            last_refill = now
+            if msg_tokens < 1:
                 await websocket.close(code=1013)  # Try again later
                 break
             await websocket.receive_text()
-            msg_timestamps.append(now)
+            msg_tokens -= 1
     except WebSocketDisconnect:
         manager.disconnect(websocket, user_id)
     except Exception:
@@ -0,0 +1,37 @@
+# app/core/admin_rate_guard.py
+"""
+Freno en proceso para patrones de acceso abusivos de administradores
+(p. ej. recorrer toda la paginación de /users en bucle).
+Complementa al rate limiter global: corta antes de tocar Mongo y no depende de Redis.
+"""
+
+from typing import Tuple
+
+from fastapi import Depends, HTTPException, Request, status
+
+from app.core.auth import get_admin_or_superadmin_user
+from app.models.users import User
+from app.utils.bucket_rate_limit import BucketTimeRateLimit
+
+ADMIN_GUARD_BUCKET_SECONDS = 60
+ADMIN_GUARD_BUCKETS = 5
+ADMIN_GUARD_MAX_REQUESTS = 300  # Por (admin, endpoint) en la ventana de 5 minutos
+
+_admin_access_limit = BucketTimeRateLimit(
+    ADMIN_GUARD_BUCKET_SECONDS, ADMIN_GUARD_BUCKETS, ADMIN_GUARD_MAX_REQUESTS
+)
+
+
+async def get_rate_guarded_admin_user(
+    request: Request,
+    current_user: User = Depends(get_admin_or_superadmin_user),
+) -> User:
+    """Igual que get_admin_or_superadmin_user, pero responde 429 ante ráfagas sostenidas."""
+    route = request.scope.get("route")
+    key: Tuple[str, str] = (str(current_user.id), route.path if route else request.url.path)
+    if not _admin_access_limit.hit(key):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiadas solicitudes. Intenta nuevamente en unos minutos."
+        )
+    return current_user
@@ -1,13 +1,24 @@
 # app/core/auth.py
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Union
+from typing import Optional, Union
 import jwt
 from jwt import PyJWTError, ExpiredSignatureError
 from fastapi import Depends, HTTPException, status, Request
 import bcrypt
-from app.core.config import SECRET_KEY_AUTH, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from cachetools import TTLCache
+import orjson
+from app.core.config import SECRET_KEY_AUTH, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, BCRYPT_ROUNDS
 from app.core.database import users_collection
-from app.models.users import User
+from app.core.redis_client import redis_client
+from app.models.users import USER_ADAPTER, USER_AUTH_PROJECTION, User, UserSummary
+
+logger = logging.getLogger(__name__)
 
 # Nueva dependencia: extrae el token de las cookies de la solicitud
 async def get_token_from_cookie(request: Request):
@@ -20,10 +31,204 @@ async def get_token_from_cookie(request: Request):
         )
     return token
 
+# Cache corto token → User para no repetir la verificación del JWT y la consulta
+# a Mongo en ráfagas de requests con la misma cookie. El TTL acota la latencia
+# con la que se reflejan revocaciones y cambios en el usuario.
+# Dos niveles: memoria del worker y, con REDIS_URL, Redis compartido entre workers
+# (mismo TTL, así el segundo nivel no alarga la ventana de desfase).
+CURRENT_USER_CACHE_TTL_SECONDS = 15
+_current_user_cache = TTLCache(maxsize=10_000, ttl=CURRENT_USER_CACHE_TTL_SECONDS)
+_current_user_locks: dict[str, asyncio.Lock] = {}
+
+# Índice username → claves cacheadas (local y, con Redis, un set por usuario), para poder
+# descartar al instante a un usuario desactivado, eliminado o con rol cambiado.
+# Las invalidaciones se publican por Redis para que cada worker limpie su memoria.
+_current_user_keys_by_username = TTLCache(maxsize=10_000, ttl=CURRENT_USER_CACHE_TTL_SECONDS)
+USER_INVALIDATION_CHANNEL = "current_user_invalidations"
+_user_invalidation_listener: Optional[asyncio.Task] = None
+
+
+def _token_cache_key(token: str) -> str:
+    return hashlib.blake2b(token.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _shared_user_key(cache_key: str) -> str:
+    return f"current_user:{cache_key}"
+
+
+def _shared_user_index_key(username: str) -> str:
+    return f"current_user_keys:{username}"
+
+
+def _set_local_cached_user(cache_key: str, user: User):
+    _current_user_cache[cache_key] = user
+    cache_keys = _current_user_keys_by_username.get(user.username, set())
+    cache_keys.add(cache_key)
+    _current_user_keys_by_username[user.username] = cache_keys  # Reasignar renueva el TTL
+
+
+def _drop_local_cached_user(username: str):
+    for cache_key in _current_user_keys_by_username.pop(username, set()):
+        _current_user_cache.pop(cache_key, None)
+
+
+async def _get_shared_cached_user(cache_key: str) -> Optional[User]:
+    if not redis_client:
+        return None
+    try:
+        cached = await redis_client.get(_shared_user_key(cache_key))
+    except Exception as e:
+        logger.warning(f"[AUTH] Error leyendo usuario cacheado de Redis: {str(e)}")
+        return None
+    return USER_ADAPTER.validate_python(orjson.loads(cached)) if cached is not None else None
+
+
+async def _set_shared_cached_user(cache_key: str, user: User):
+    if not redis_client:
+        return
+    try:
+        index_key = _shared_user_index_key(user.username)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(
+                _shared_user_key(cache_key),
+                # El hash de la contraseña no se guarda en el cache compartido
+                orjson.dumps(user.model_dump(by_alias=True, exclude={"password_hash"}), default=str),
+                ex=CURRENT_USER_CACHE_TTL_SECONDS,
+            )
+            pipe.sadd(index_key, cache_key)
+            pipe.expire(index_key, CURRENT_USER_CACHE_TTL_SECONDS)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"[AUTH] Error guardando usuario cacheado en Redis: {str(e)}")
+
+
+async def invalidate_cached_user(token: Union[str, None]):
+    """Descarta el usuario cacheado para un token (logout, cambios de perfil, etc.)."""
+    if not token:
+        return
+    cache_key = _token_cache_key(token)
+    _current_user_cache.pop(cache_key, None)
+    if redis_client:
+        try:
+            await redis_client.delete(_shared_user_key(cache_key))
+        except Exception as e:
+            logger.warning(f"[AUTH] Error invalidando usuario cacheado en Redis: {str(e)}")
+
+
+async def invalidate_cached_user_by_username(username: str):
+    """
+    Descarta todas las entradas cacheadas de un usuario (todas sus sesiones, en todos los workers).
+    Se usa al desactivar, eliminar, rechazar o cambiar el rol de un usuario: la revocación
+    no espera al TTL del cache.
+    """
+    _drop_local_cached_user(username)
+    if not redis_client:
+        return
+    try:
+        index_key = _shared_user_index_key(username)
+        cache_keys = await redis_client.smembers(index_key)
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.delete(index_key, *(_shared_user_key(cache_key) for cache_key in cache_keys))
+            pipe.publish(USER_INVALIDATION_CHANNEL, username)
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"[AUTH] Error invalidando sesiones cacheadas de {username} en Redis: {str(e)}")
+
+
+async def _listen_user_invalidations():
+    """Limpia la memoria de este worker ante invalidaciones publicadas por otros workers."""
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(USER_INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        _drop_local_cached_user(message["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[AUTH] Error en la suscripción de invalidaciones de usuarios: {str(e)}")
+            # Sin suscripción no se puede confiar en la memoria local
+            _current_user_cache.clear()
+            _current_user_keys_by_username.clear()
+            await asyncio.sleep(1)
+
+
+def start_user_invalidation_listener():
+    """Inicia la suscripción a invalidaciones (solo con Redis; sin él hay un único worker)."""
+    global _user_invalidation_listener
+    if redis_client and _user_invalidation_listener is None:
+        _user_invalidation_listener = asyncio.create_task(_listen_user_invalidations())
+
+
+def stop_user_invalidation_listener():
+    global _user_invalidation_listener
+    if _user_invalidation_listener is not None:
+        _user_invalidation_listener.cancel()
+        _user_invalidation_listener = None
+
+
 # Se actualiza get_current_user para usar el token proveniente de la cookie
-async def get_current_user(token: str = Depends(get_token_from_cookie)) -> User:
+async def get_current_user(request: Request, token: str = Depends(get_token_from_cookie)) -> User:
+    user = await _get_user_for_token(token)
+    # Lo usa el rate limiter para contar por usuario en lugar de por IP
+    request.state.user_id = str(user.id)
+    # Lo usa el middleware de logging, así no vuelve a decodificar el JWT
+    request.state.username = user.username
+    return user
+
+
+async def _get_user_for_token(token: str) -> User:
+    cache_key = _token_cache_key(token)
+    user = _current_user_cache.get(cache_key)
+    if user is not None:
+        return user
+
+    # Un solo lookup por token aunque lleguen varias requests concurrentes
+    lock = _current_user_locks.setdefault(cache_key, asyncio.Lock())
+    try:
+        async with lock:
+            user = _current_user_cache.get(cache_key)
+            if user is None:
+                user = await _get_shared_cached_user(cache_key)
+                if user is None:
+                    user = await _resolve_user_from_token(token)
+                    await _set_shared_cached_user(cache_key, user)
+                _set_local_cached_user(cache_key, user)
+    finally:
+        _current_user_locks.pop(cache_key, None)
+    return user
+
+
+# Decodificador JWT reutilizable: opciones y lista de algoritmos fijadas una sola vez.
+# Exige `exp` y `sub`, que create_access_token emite siempre.
+_jwt_decoder = jwt.PyJWT(options={"require": ["exp", "sub"]})
+_JWT_ALGORITHMS = [ALGORITHM]
+
+# Payloads ya verificados, por hash del token: el WebSocket y el middleware de logging
+# decodifican la misma cookie en cada conexión/request. Solo se cachean tokens válidos
+# y la expiración se vuelve a chequear en cada hit.
+DECODED_TOKEN_CACHE_TTL_SECONDS = 60
+_decoded_token_cache = TTLCache(maxsize=10_000, ttl=DECODED_TOKEN_CACHE_TTL_SECONDS)
+
+
+def decode_access_token(token: str) -> dict:
+    """Verifica firma y expiración del JWT de sesión. Lanza PyJWTError si no es válido."""
+    cache_key = _token_cache_key(token)
+    payload = _decoded_token_cache.get(cache_key)
+    if payload is not None:
+        if payload["exp"] > time.time():
+            return payload
+        _decoded_token_cache.pop(cache_key, None)
+        raise ExpiredSignatureError("Signature has expired")
+    payload = _jwt_decoder.decode(token, SECRET_KEY_AUTH, algorithms=_JWT_ALGORITHMS)
+    _decoded_token_cache[cache_key] = payload
+    return payload
+
+
+async def _resolve_user_from_token(token: str) -> User:
     try:
-        payload = jwt.decode(token, SECRET_KEY_AUTH, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         username: str = payload.get("sub")
         if username is None:
             raise HTTPException(
@@ -31,14 +236,14 @@ async def get_current_user(token: str = Depends(get_token_from_cookie)) -> User:
                 detail="Token inválido",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        user_data = await users_collection.find_one({"username": username})
+        user_data = await users_collection.find_one({"username": username}, USER_AUTH_PROJECTION)
         if user_data is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Usuario no encontrado",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        return User(**user_data)
+        return USER_ADAPTER.validate_python(user_data)
     except ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -64,7 +269,7 @@ def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None
 
 def hash_password(password: str) -> str:
     pwd_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed_password = bcrypt.hashpw(pwd_bytes, salt)
     return hashed_password.decode('utf-8')
 
@@ -72,6 +277,77 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 
+# Pool de procesos para bcrypt: es CPU intensivo y no debe bloquear el event loop.
+# Se crea de forma diferida para que cada worker de uvicorn tenga el suyo.
+BCRYPT_POOL_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+_bcrypt_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_bcrypt_pool() -> ProcessPoolExecutor:
+    global _bcrypt_pool
+    if _bcrypt_pool is None:
+        _bcrypt_pool = ProcessPoolExecutor(max_workers=BCRYPT_POOL_WORKERS)
+    return _bcrypt_pool
+
+
+def shutdown_bcrypt_pool():
+    """Libera los procesos del pool de bcrypt (al apagar la aplicación)."""
+    global _bcrypt_pool
+    if _bcrypt_pool is not None:
+        _bcrypt_pool.shutdown(wait=False, cancel_futures=True)
+        _bcrypt_pool = None
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Versión no bloqueante de `verify_password`, ejecutada en el pool de procesos."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_bcrypt_pool(), verify_password, plain_password, hashed_password)
+
+
+async def verify_current_password(user: User, plain_password: str) -> bool:
+    """
+    Verifica la contraseña del usuario autenticado. El hash se lee de Mongo:
+    el User de get_current_user puede venir del cache compartido, que no lo incluye.
+    """
+    user_data = await users_collection.find_one({"_id": user.id}, {"password_hash": 1})
+    if not user_data or not user_data.get("password_hash"):
+        return False
+    return await verify_password_async(plain_password, user_data["password_hash"])
+
+
+async def hash_password_async(password: str) -> str:
+    """Versión no bloqueante de `hash_password`, ejecutada en el pool de procesos."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_bcrypt_pool(), hash_password, password)
+
+
+# Cache por proceso de verificaciones bcrypt exitosas.
+# Nunca se cachean fallos para no abaratar ataques de fuerza bruta.
+PASSWORD_VERIFY_CACHE_TTL_SECONDS = 60
+_password_verify_cache = TTLCache(maxsize=2048, ttl=PASSWORD_VERIFY_CACHE_TTL_SECONDS)
+
+
+async def verify_password_cached(username: str, plain_password: str, hashed_password: str) -> bool:
+    """
+    Igual que `verify_password`, pero evita repetir bcrypt para credenciales
+    válidas recientes del mismo usuario.
+    La clave incluye el prefijo `$2b$<cost>$<salt>` del hash, por lo que un
+    cambio de contraseña invalida las entradas previas.
+    """
+    cache_key = (
+        username.lower(),
+        hashlib.sha256(plain_password.encode('utf-8')).digest()[:16],
+        hashed_password[:29],
+    )
+    if cache_key in _password_verify_cache:
+        return True
+
+    is_valid = await verify_password_async(plain_password, hashed_password)
+    if is_valid:
+        _password_verify_cache[cache_key] = True
+    return is_valid
+
+
 # ────────────────────────────────────────────────────────────────
 # Nuevas dependencias de autorización para el sistema de usuarios
 # ────────────────────────────────────────────────────────────────
@@ -106,7 +382,7 @@ async def get_superadmin_user(current_user: User = Depends(get_current_user)) ->
     return current_user
 
 
-def can_manage_user(admin_user: User, target_user: User) -> bool:
+def can_manage_user(admin_user: User, target_user: Union[User, UserSummary]) -> bool:
     """
     Determina si un admin puede gestionar a otro usuario.
     """
@@ -128,9 +404,20 @@ def validate_password_strength(password: str) -> bool:
     if len(password) < 8:
         return False
     
-    # Al menos una letra mayúscula, una minúscula y un número
-    has_upper = any(c.isupper() for c in password)
-    has_lower = any(c.islower() for c in password)
-    has_digit = any(c.isdigit() for c in password)
-    
-    return has_upper and has_lower and has_digit
+    # Al menos una letra mayúscula, una minúscula y un número.
+    # Un solo recorrido sobre los caracteres distintos, cortando al cumplir las tres
+    # (isupper/islower/isdigit: acepta también letras acentuadas como Ñ o á).
+    has_upper = has_lower = has_digit = False
+    for c in set(password):
+        if c.isupper():
+            has_upper = True
+        elif c.islower():
+            has_lower = True
+        elif c.isdigit():
+            has_digit = True
+        else:
+            continue
+        if has_upper and has_lower and has_digit:
+            return True
+
+    return False
@@ -14,6 +14,13 @@ MONGO_DB = os.getenv("MONGO_DB")
 SECRET_KEY_AUTH = os.getenv("SECRET_KEY_AUTH")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "120"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))  # Costo de bcrypt para hashes nuevos
+
+# Configuración de Redis (opcional: estado compartido entre workers)
+REDIS_URL = os.getenv("REDIS_URL")
+
+# Profiling de endpoints con pyinstrument (`?profile=1`), solo para entornos de desarrollo
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
 
 # Configuración de CORS
 API_COOKIE_DOMAIN = os.getenv("API_COOKIE_DOMAIN", "localhost")
@@ -45,7 +52,10 @@ ALLOWED_EMAIL_DOMAIN = os.getenv("ALLOWED_EMAIL_DOMAIN", "@empresa.com").strip()
 SKIP_DOMAIN_VALIDATION_LOCAL = os.getenv("SKIP_DOMAIN_VALIDATION_LOCAL", "true").lower() == "true"
 
 # Admin Notifications
-ADMIN_NOTIFICATION_EMAILS = os.getenv("ADMIN_NOTIFICATION_EMAILS", "").split(",")
+# Tupla ya limpia: sin espacios ni entradas vacías (con la variable sin definir queda vacía)
+ADMIN_NOTIFICATION_EMAILS = tuple(
+    email.strip() for email in os.getenv("ADMIN_NOTIFICATION_EMAILS", "").split(",") if email.strip()
+)
 NOTIFY_ALL_ADMINS = os.getenv("NOTIFY_ALL_ADMINS", "false").lower() == "true"
 
 # Frontend URLs
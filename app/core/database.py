@@ -1,13 +1,44 @@
 # app/core/database.py
 
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+import weakref
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from pymongo.server_api import ServerApi
 from app.core.config import MONGO_URI, MONGO_DB
 
+# Tamaño del pool de conexiones por cliente (acorde a la concurrencia de un worker)
+MONGO_MAX_POOL_SIZE = 50
+
+
+def _new_client() -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(MONGO_URI, server_api=ServerApi('1'), maxPoolSize=MONGO_MAX_POOL_SIZE)
+
+
 # Cliente asíncrono para MongoDB
-client = AsyncIOMotorClient(MONGO_URI, server_api=ServerApi('1'))
+client = _new_client()
 db = client[MONGO_DB]
 
 # Colecciones de la base de datos
 users_collection = db["users"]
-docs_collection = db["documents"]
\ No newline at end of file
+docs_collection = db["documents"]
+
+# Collation española sin distinción de mayúsculas ni tildes (para ordenar por texto)
+SPANISH_COLLATION = {"locale": "es", "strength": 1}
+
+
+# Un cliente de Motor queda atado al event loop en el que se usa. El código que corre en
+# un loop propio (threads auxiliares) obtiene aquí un cliente por loop, creado una sola vez,
+# en lugar de abrir un cliente nuevo en cada operación.
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncIOMotorClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_loop_database() -> AsyncIOMotorDatabase:
+    """Base de datos sobre un cliente propio del event loop en ejecución (no usar desde el loop de la app)."""
+    loop = asyncio.get_running_loop()
+    loop_client = _loop_clients.get(loop)
+    if loop_client is None:
+        loop_client = _loop_clients[loop] = _new_client()
+    return loop_client[MONGO_DB]
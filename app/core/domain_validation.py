@@ -4,6 +4,24 @@ import os
 from app.core.config import ALLOWED_EMAIL_DOMAIN, SKIP_DOMAIN_VALIDATION_LOCAL, ENVIRONMENT
 
 
+def _parse_allowed_domains(value) -> frozenset:
+    """Normaliza ALLOWED_EMAIL_DOMAIN a un conjunto de sufijos en minúsculas que empiezan con '@'."""
+    # Compatibilidad: ALLOWED_EMAIL_DOMAIN debería ser una cadena leída desde env (posible coma-separada),
+    # pero soportamos también listas por si hubiera cambios anteriores.
+    if isinstance(value, (list, tuple, set, frozenset)):
+        parts = [p.strip().lower() for p in value if p]
+    else:
+        raw = (value or "").strip()
+        parts = [p.strip().lower() for p in raw.split(",") if p.strip()]
+
+    # Normalizar: asegurar que cada dominio comience con '@'
+    return frozenset((p if p.startswith("@") else "@" + p) for p in parts)
+
+
+# La configuración no cambia en tiempo de ejecución: se procesa una sola vez al importar
+ALLOWED_DOMAIN_SUFFIXES = _parse_allowed_domains(ALLOWED_EMAIL_DOMAIN)
+
+
 def validate_email_domain(email: str) -> bool:
     """
     Valida el dominio del email según configuración.
@@ -13,20 +31,9 @@ def validate_email_domain(email: str) -> bool:
     if SKIP_DOMAIN_VALIDATION_LOCAL:
         return True
 
-    email_l = email.lower()
-
-    # Compatibilidad: ALLOWED_EMAIL_DOMAIN debería ser una cadena leída desde env (posible coma-separada),
-    # pero soportamos también listas por si hubiera cambios anteriores.
-    if isinstance(ALLOWED_EMAIL_DOMAIN, (list, tuple)):
-        parts = [p.strip().lower() for p in ALLOWED_EMAIL_DOMAIN if p]
-    else:
-        raw = (ALLOWED_EMAIL_DOMAIN or "").strip()
-        parts = [p.strip().lower() for p in raw.split(",") if p.strip()]
-
-    # Normalizar: asegurar que cada dominio comience con '@'
-    allowed = [(p if p.startswith("@") else "@" + p) for p in parts]
-
-    return any(email_l.endswith(domain) for domain in allowed)
+    # Cada sufijo empieza con '@', así que coincidir con él equivale a que el dominio del
+    # email (lo que sigue al último '@') sea exactamente ese: basta un lookup en el set
+    return "@" + email.rpartition("@")[2].lower() in ALLOWED_DOMAIN_SUFFIXES
 
 
 def extract_company_domain(email: str) -> str:
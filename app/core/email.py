@@ -1,5 +1,6 @@
 # app/core/email.py
 
+import asyncio
 import logging
 from typing import List, Dict, Any
 import sib_api_v3_sdk
@@ -49,7 +50,10 @@ class EmailService:
                 html_content=html_content
             )
             
-            api_response = self.api_instance.send_transac_email(send_smtp_email)
+            # El SDK de Brevo es síncrono: se ejecuta en un hilo para no bloquear el event loop
+            api_response = await asyncio.to_thread(
+                self.api_instance.send_transac_email, send_smtp_email
+            )
             logger.info(f"Email enviado exitosamente a {to}: {api_response}")
             return True
             
@@ -73,11 +77,13 @@ class EmailService:
         Returns:
             Dict[str, bool]: Diccionario con el resultado de cada envío
         """
-        results = {}
-        for email in emails:
-            if email.strip():  # Solo enviar si el email no está vacío
-                results[email] = await self.send_email(email, subject, html_content, sender_name)
-        return results
+        # Solo enviar si el email no está vacío. Los envíos van en paralelo: send_email
+        # no lanza excepciones, así que un fallo no cancela al resto.
+        recipients = [email for email in emails if email.strip()]
+        sent = await asyncio.gather(
+            *(self.send_email(email, subject, html_content, sender_name) for email in recipients)
+        )
+        return dict(zip(recipients, sent))
 
 
 # Instancia global del servicio de email
@@ -1,4 +1,31 @@
+from fastapi import Request
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
-limiter = Limiter(key_func=get_remote_address, default_limits=["60/minute"])
+from app.core.config import REDIS_URL
+
+
+def user_or_ip_key(request: Request) -> str:
+    """
+    Clave del rate limit: el usuario autenticado si la request ya pasó por get_current_user,
+    si no la IP. Detrás de un NAT corporativo o un balanceador sin X-Forwarded-For muchos
+    usuarios comparten IP y agotarían un mismo contador.
+    """
+    user_id = getattr(request.state, "user_id", None)
+    if user_id:
+        return f"user:{user_id}"
+    return get_remote_address(request)
+
+
+# Con REDIS_URL los contadores se comparten entre workers/pods; sin él, memoria local.
+# "moving-window" evita las ráfagas de 2x en el borde de cada ventana fija.
+# Si Redis no responde se cuenta en memoria de cada worker (y cualquier otro error del
+# storage se loggea en lugar de responder 500): una caída de Redis no tumba la API.
+limiter = Limiter(
+    key_func=user_or_ip_key,
+    default_limits=["60/minute"],
+    storage_uri=REDIS_URL or "memory://",
+    strategy="moving-window",
+    in_memory_fallback_enabled=True,
+    swallow_errors=True,
+)
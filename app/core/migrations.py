@@ -0,0 +1,235 @@
+# app/core/migrations.py
+"""
+Migraciones idempotentes que se ejecutan al iniciar la aplicación.
+Cada paso puede correrse múltiples veces sin efectos secundarios.
+"""
+
+import logging
+
+from pymongo import UpdateOne
+
+from app.core.database import docs_collection, users_collection, SPANISH_COLLATION
+from app.utils.page_relevance import relevant_page_expr
+from app.utils.search_normalization import SEARCH_FIELDS, build_search_fields
+
+logger = logging.getLogger(__name__)
+
+
+class MigrationError(RuntimeError):
+    """Falla de migración que impide arrancar la aplicación (p. ej. un índice único faltante)."""
+
+
+# ────────────────────────────────────────────────────────────────
+# BACKFILLS
+# ────────────────────────────────────────────────────────────────
+
+async def backfill_username_lower():
+    """
+    Completa `username_lower` en usuarios creados antes de que existiera el campo.
+    Se usa para el login case-insensitive mediante igualdad indexada.
+    """
+    result = await users_collection.update_many(
+        {"username_lower": {"$exists": False}},
+        [{"$set": {"username_lower": {"$toLower": "$username"}}}],
+    )
+    if result.modified_count:
+        logger.info(f"[MIGRATIONS] username_lower completado en {result.modified_count} usuarios")
+
+
+async def backfill_email_lower():
+    """
+    Completa `email_lower` en usuarios creados antes de que existiera el campo.
+    Se usa para buscar por email (case-insensitive) mediante igualdad indexada.
+    """
+    result = await users_collection.update_many(
+        {"email_lower": {"$exists": False}},
+        [{"$set": {"email_lower": {"$toLower": "$email"}}}],
+    )
+    if result.modified_count:
+        logger.info(f"[MIGRATIONS] email_lower completado en {result.modified_count} usuarios")
+
+
+async def backfill_document_search_fields(batch_size: int = 500):
+    """
+    Completa los campos `*_normalized` de búsqueda en documentos antiguos.
+    La normalización (quitar tildes) se hace en Python, por eso se escribe en lotes.
+    """
+    cursor = docs_collection.find(
+        {"name_normalized": {"$exists": False}},
+        {"name": 1, "uploaded_by": 1, "company_info.company_name": 1, "company_info.company_cuit": 1},
+    )
+    operations = []
+    updated = 0
+    async for doc in cursor:
+        company_info = doc.get("company_info") or {}
+        operations.append(UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": build_search_fields(
+                name=doc.get("name"),
+                uploaded_by=doc.get("uploaded_by"),
+                company_name=company_info.get("company_name"),
+                company_cuit=company_info.get("company_cuit"),
+            )},
+        ))
+        if len(operations) >= batch_size:
+            await docs_collection.bulk_write(operations, ordered=False)
+            updated += len(operations)
+            operations = []
+    if operations:
+        await docs_collection.bulk_write(operations, ordered=False)
+        updated += len(operations)
+    if updated:
+        logger.info(f"[MIGRATIONS] Campos de búsqueda completados en {updated} documentos")
+
+
+async def backfill_relevant_page_ids():
+    """
+    Completa `relevant_page_ids` en documentos escritos antes de que existiera el campo.
+    Se calcula en el servidor con el mismo criterio que usan los nodos del graph.
+    """
+    result = await docs_collection.update_many(
+        {"relevant_page_ids": {"$exists": False}},
+        [{"$set": {"relevant_page_ids": {
+            "$filter": {
+                "input": {"$range": [0, {"$size": {"$ifNull": ["$pages", []]}}]},
+                "as": "i",
+                "cond": {"$let": {
+                    "vars": {"page": {"$arrayElemAt": ["$pages", "$$i"]}},
+                    "in": relevant_page_expr("$$page"),
+                }},
+            }
+        }}}],
+    )
+    if result.modified_count:
+        logger.info(f"[MIGRATIONS] relevant_page_ids completado en {result.modified_count} documentos")
+
+
+# ────────────────────────────────────────────────────────────────
+# ÍNDICES
+# ────────────────────────────────────────────────────────────────
+
+# Índices únicos de los que depende la detección de usuarios duplicados (registro y perfil):
+# si no se pueden crear, la aplicación no debe arrancar
+REQUIRED_UNIQUE_USER_INDEXES = ("username_lower", "email_lower")
+
+# Cargas directas abandonadas: el DocFile pendiente se borra pasado este tiempo.
+# Holgado respecto de la validez de la URL PUT (UPLOAD_URL_EXPIRATION_SECONDS, 15 minutos).
+PENDING_UPLOAD_TTL_SECONDS = 24 * 60 * 60
+
+
+async def _create_index(collection, keys, failures: list, **kwargs) -> None:
+    """Crea un índice; si falla lo registra en `failures` y sigue con los demás."""
+    try:
+        await collection.create_index(keys, **kwargs)
+    except Exception as e:
+        logger.error(f"[MIGRATIONS] Error creando índice {collection.name}.{keys}: {str(e)}")
+        failures.append(f"{collection.name}.{keys}")
+
+
+async def ensure_indexes():
+    """
+    Crea los índices que necesitan las consultas de la API.
+    Cada índice se crea por separado: uno fallido no impide crear el resto.
+    Lanza MigrationError si falla alguno de REQUIRED_UNIQUE_USER_INDEXES.
+    """
+    failures: list = []
+    required_failures: list = []
+
+    await _create_index(users_collection, "username", failures, unique=True)  # Lookup de get_current_user
+    for field in REQUIRED_UNIQUE_USER_INDEXES:
+        await _create_index(users_collection, field, required_failures, unique=True)
+    # Tokens de verificación y reset: solo los usuarios con un token pendiente entran al índice
+    await _create_index(users_collection, "email_verification_token", failures, sparse=True)
+    await _create_index(users_collection, "password_reset_token", failures, sparse=True)
+
+    # /pending-users: índice parcial, solo contiene a los usuarios pendientes de aprobación
+    await _create_index(
+        users_collection,
+        [("created_at", 1)],
+        failures,
+        name="pending_approval_created_at",
+        partialFilterExpression={"status": "pending_approval", "email_verified": True},
+    )
+    # Reemplazado por el índice parcial: se elimina si quedó de un arranque anterior
+    try:
+        if "status_1_email_verified_1_created_at_1" in await users_collection.index_information():
+            await users_collection.drop_index("status_1_email_verified_1_created_at_1")
+    except Exception as e:
+        logger.error(f"[MIGRATIONS] Error eliminando índice reemplazado: {str(e)}")
+
+    # Listados de administración: igualdad → orden (ESR) sobre created_at
+    await _create_index(users_collection, [("status", 1), ("role", 1), ("created_at", -1)], failures)  # /users con status
+    await _create_index(users_collection, [("role", 1), ("status", 1), ("created_at", -1)], failures)  # /users con rol
+
+    # Búsqueda por prefijo en /documents (siempre filtrada por tenant)
+    for field in SEARCH_FIELDS:
+        await _create_index(docs_collection, [("tenant_id", 1), (field, 1)], failures)
+
+    # Listado de /documents: orden por defecto (binario) y órdenes por texto (con collation).
+    # Igualdad → orden (ESR): los filtros por status usan su propio índice con upload_date.
+    await _create_index(docs_collection, [("tenant_id", 1), ("upload_date", -1)], failures)
+    await _create_index(docs_collection, [("tenant_id", 1), ("status", 1), ("upload_date", -1)], failures)
+    await _create_index(docs_collection, [("tenant_id", 1), ("validation.status", 1), ("upload_date", -1)], failures)
+    for field in ("name", "uploaded_by", "company_info.company_name"):
+        await _create_index(docs_collection, [("tenant_id", 1), (field, 1)], failures, collation=SPANISH_COLLATION)
+
+    # TTL de cargas directas no confirmadas (solo documentos con upload_pending)
+    await _create_index(
+        docs_collection,
+        [("pending_since", 1)],
+        failures,
+        name="pending_upload_ttl",
+        expireAfterSeconds=PENDING_UPLOAD_TTL_SECONDS,
+        partialFilterExpression={"upload_pending": True},
+    )
+
+    if failures:
+        logger.error(f"[MIGRATIONS] Índices no creados ({len(failures)}): {', '.join(failures)}")
+    if required_failures:
+        raise MigrationError(
+            f"No se pudieron crear índices únicos requeridos: {', '.join(required_failures)}"
+        )
+
+
+async def verify_unique_user_indexes():
+    """
+    Comprueba que existan los índices únicos de REQUIRED_UNIQUE_USER_INDEXES.
+    El registro y el cambio de username no consultan duplicados antes de escribir:
+    dependen de DuplicateKeyError, así que sin estos índices se crearían cuentas duplicadas.
+    """
+    index_info = await users_collection.index_information()
+    unique_fields = {
+        info["key"][0][0]
+        for info in index_info.values()
+        if info.get("unique") and len(info["key"]) == 1 and not info.get("partialFilterExpression")
+    }
+    missing = [field for field in REQUIRED_UNIQUE_USER_INDEXES if field not in unique_fields]
+    if missing:
+        raise MigrationError(f"Faltan índices únicos en users: {', '.join(missing)}")
+
+
+# Orden de ejecución: los backfills van antes que los índices únicos
+MIGRATION_STEPS = [
+    backfill_username_lower,
+    backfill_email_lower,
+    backfill_document_search_fields,
+    backfill_relevant_page_ids,
+    ensure_indexes,
+    verify_unique_user_indexes,
+]
+
+
+async def run_migrations():
+    """
+    Ejecuta todos los pasos de migración.
+    Un paso fallido se loggea pero no impide el arranque de la aplicación,
+    salvo un MigrationError, que se propaga y aborta el arranque.
+    """
+    for step in MIGRATION_STEPS:
+        try:
+            await step()
+        except MigrationError as e:
+            logger.critical(f"[MIGRATIONS] {step.__name__}: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"[MIGRATIONS] Error ejecutando {step.__name__}: {str(e)}")
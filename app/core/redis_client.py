@@ -0,0 +1,8 @@
+# app/core/redis_client.py
+
+from redis.asyncio import Redis
+from app.core.config import REDIS_URL
+
+# Cliente asíncrono de Redis compartido por toda la aplicación.
+# Es opcional: sin REDIS_URL los módulos que lo usan recurren a su fallback en memoria.
+redis_client = Redis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None
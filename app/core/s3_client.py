@@ -1,9 +1,15 @@
 # app/core/s3_client.py
 
+import asyncio
+import threading
+from typing import List, Optional
+
 import boto3
 from botocore.config import Config
+from cachetools import TTLCache
 from urllib.parse import urlparse
 from app.core.config import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_DEFAULT_REGION, S3_BUCKET_NAME
+from app.core.s3_presign import PresignBuilder
 
 # Configuración del pool de conexiones para evitar warnings de pool lleno
 boto_config = Config(
@@ -33,40 +39,69 @@ s3_client = boto3.client(
     aws_access_key_id=AWS_ACCESS_KEY_ID,
     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
     region_name=AWS_DEFAULT_REGION,
+    # Endpoint regional fijo: las URLs ya salen con `{bucket}.s3.{region}.amazonaws.com`
+    endpoint_url=f"https://s3.{AWS_DEFAULT_REGION}.amazonaws.com",
     config=boto_config
 )
 
-def generate_presigned_url(key: str, expiration: int = 3600) -> str:
+# Firmador local de URLs (solo con credenciales estáticas; si no, se usa boto3)
+presign_builder = (
+    PresignBuilder(AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_DEFAULT_REGION, S3_BUCKET_NAME)
+    if AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY
+    else None
+)
+
+# Operación de boto3 equivalente a cada método HTTP pre-firmable
+PRESIGN_CLIENT_METHODS = {"GET": "get_object", "PUT": "put_object"}
+
+def generate_presigned_url(
+    key: str, expiration: int = 3600, method: str = "GET", content_type: Optional[str] = None
+) -> str:
     """
     Genera una URL prefirmada para acceder a un objeto en S3.
     :param key: La clave del objeto en el bucket.
     :param expiration: Tiempo en segundos de validez de la URL.
+    :param method: "GET" para leer el objeto o "PUT" para subirlo directamente desde el cliente.
+    :param content_type: Content-Type firmado (solo PUT); el cliente debe enviar ese mismo header.
     :return: URL prefirmada.
     """
     try:
-        # Generar URL con endpoint específico de la región
-        url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': S3_BUCKET_NAME, 
-                'Key': key
-            },
+        # Con credenciales estáticas se firma localmente (sin botocore, apto para el event loop)
+        if presign_builder:
+            return presign_builder.presigned_url(key, expiration, method, content_type)
+
+        params = {
+            'Bucket': S3_BUCKET_NAME, 
+            'Key': key
+        }
+        if content_type:
+            params['ContentType'] = content_type
+        return s3_client.generate_presigned_url(
+            PRESIGN_CLIENT_METHODS[method],
+            Params=params,
             ExpiresIn=expiration,
-            HttpMethod='GET'
+            HttpMethod=method
         )
-        
-        # Forzar el uso del endpoint regional si no lo está usando
-        if f".s3.{AWS_DEFAULT_REGION}.amazonaws.com" not in url:
-            url = url.replace(
-                f"{S3_BUCKET_NAME}.s3.amazonaws.com",
-                f"{S3_BUCKET_NAME}.s3.{AWS_DEFAULT_REGION}.amazonaws.com"
-            )
-        
-        return url
-        
+
     except Exception as e:
         raise e
 
+# Cache de URLs prefirmadas por (image_path, expiración).
+# El TTL es menor que la validez de la URL: lo que se sirve desde cache sigue vigente
+# al menos (expiración - TTL) segundos. Se usa desde threads, de ahí el lock.
+PRESIGNED_URL_CACHE_TTL_SECONDS = 600
+_presigned_url_cache = TTLCache(maxsize=50_000, ttl=PRESIGNED_URL_CACHE_TTL_SECONDS)
+_presigned_url_cache_lock = threading.Lock()
+
+
+def get_cached_presigned_url(image_url: str, expiration: int = 3600) -> Optional[str]:
+    """
+    Devuelve la URL prefirmada cacheada para `image_url`, o None si no hay una vigente.
+    """
+    with _presigned_url_cache_lock:
+        return _presigned_url_cache.get((image_url, expiration))
+
+
 def get_presigned_url_from_image_path(image_url: str, expiration: int = 3600) -> str:
     """
     Dado el valor almacenado en la base de datos (la URL completa), extrae la clave del objeto y
@@ -77,17 +112,42 @@ def get_presigned_url_from_image_path(image_url: str, expiration: int = 3600) ->
     :return: URL prefirmada para acceder al objeto.
     """
     try:
+        cached_url = get_cached_presigned_url(image_url, expiration)
+        if cached_url:
+            return cached_url
+
         parsed = urlparse(image_url)
         # Se asume que la clave es la parte del path sin la barra inicial
         key = parsed.path.lstrip("/")
         
-        # Verificar si el objeto existe en S3 antes de generar la URL
-        try:
-            s3_client.head_object(Bucket=S3_BUCKET_NAME, Key=key)
-        except Exception as head_error:
-            raise Exception(f"Object not found in S3: {key}")
-        
-        return generate_presigned_url(key, expiration)
+        url = generate_presigned_url(key, expiration)
+
+        # Solo se cachean URLs que siguen siendo válidas más allá del TTL del cache
+        if expiration > PRESIGNED_URL_CACHE_TTL_SECONDS:
+            with _presigned_url_cache_lock:
+                _presigned_url_cache[(image_url, expiration)] = url
+
+        return url
         
     except Exception as e:
         raise e
+
+
+async def presign_image_paths(image_urls: List[str], expiration: int = 3600) -> List[str]:
+    """
+    Versión por lotes de get_presigned_url_from_image_path, en el mismo orden.
+    Si una URL no se puede firmar se devuelve la original.
+    Con firma local (solo HMAC) se resuelve en línea; con el fallback de boto3 cada
+    firma pasa por botocore, así que se reparten en el pool de threads y se esperan juntas.
+    """
+    def presign(image_url: str) -> str:
+        try:
+            return get_presigned_url_from_image_path(image_url, expiration)
+        except Exception:
+            return image_url
+
+    if presign_builder:
+        return [presign(image_url) for image_url in image_urls]
+    return list(await asyncio.gather(
+        *(asyncio.to_thread(presign, image_url) for image_url in image_urls)
+    ))
@@ -0,0 +1,91 @@
+# app/core/s3_presign.py
+"""
+Firma local de URLs pre-firmadas de S3 (SigV4 por query string) para GET/PUT de objetos.
+Equivale a `s3_client.generate_presigned_url("get_object" | "put_object", ...)` pero sin pasar por
+la maquinaria de botocore: solo hashlib/hmac, por lo que puede llamarse desde el event loop.
+"""
+
+import hashlib
+import hmac
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+SERVICE = "s3"
+
+
+def _hmac_sha256(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+
+def derive_signing_key(secret_access_key: str, datestamp: str, region: str) -> bytes:
+    """kSecret → kDate → kRegion → kService → kSigning"""
+    k_date = _hmac_sha256(("AWS4" + secret_access_key).encode("utf-8"), datestamp)
+    k_region = _hmac_sha256(k_date, region)
+    k_service = _hmac_sha256(k_region, SERVICE)
+    return _hmac_sha256(k_service, "aws4_request")
+
+
+class PresignBuilder:
+    """
+    Generador de URLs pre-firmadas (GET/PUT) sobre el endpoint regional virtual-hosted
+    (`https://{bucket}.s3.{region}.amazonaws.com/{key}`).
+
+    La clave de firma y el scope de la credencial dependen solo del día, así que se
+    derivan una vez por día y se reutilizan: cada URL cuesta un SHA-256 y un HMAC.
+    """
+
+    def __init__(self, access_key_id: str, secret_access_key: str, region: str, bucket: str):
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.region = region
+        self.host = f"{bucket}.s3.{region}.amazonaws.com"
+        # (datestamp, signing_key, credential_scope, credential codificada); se reemplaza entera
+        self._day_state = None
+
+    def _state_for(self, datestamp: str) -> tuple:
+        state = self._day_state
+        if state is None or state[0] != datestamp:
+            credential_scope = f"{datestamp}/{self.region}/{SERVICE}/aws4_request"
+            state = (
+                datestamp,
+                derive_signing_key(self.secret_access_key, datestamp, self.region),
+                credential_scope,
+                quote(f"{self.access_key_id}/{credential_scope}", safe="~"),
+            )
+            self._day_state = state
+        return state
+
+    def presigned_url(
+        self, key: str, expiration: int = 3600, method: str = "GET", content_type: str = None
+    ) -> str:
+        """
+        Con `content_type` el header Content-Type entra en la firma: el cliente debe enviarlo
+        con ese valor exacto o S3 rechaza el PUT.
+        """
+        amz_date = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        _, signing_key, credential_scope, credential = self._state_for(amz_date[:8])
+
+        canonical_uri = "/" + quote(key, safe="/~")
+        if content_type:
+            signed_headers = "content-type;host"
+            canonical_headers = f"content-type:{content_type}\nhost:{self.host}\n"
+        else:
+            signed_headers = "host"
+            canonical_headers = f"host:{self.host}\n"
+        # Los parámetros ya están en orden alfabético, como exige el request canónico
+        canonical_query = (
+            f"X-Amz-Algorithm={ALGORITHM}"
+            f"&X-Amz-Credential={credential}"
+            f"&X-Amz-Date={amz_date}"
+            f"&X-Amz-Expires={expiration}"
+            f"&X-Amz-SignedHeaders={quote(signed_headers, safe='~')}"
+        )
+        canonical_request = f"{method}\n{canonical_uri}\n{canonical_query}\n{canonical_headers}\n{signed_headers}\nUNSIGNED-PAYLOAD"
+        string_to_sign = (
+            f"{ALGORITHM}\n{amz_date}\n{credential_scope}\n"
+            f"{hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()}"
+        )
+        signature = hmac.new(signing_key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+        return f"https://{self.host}{canonical_uri}?{canonical_query}&X-Amz-Signature={signature}"
@@ -7,6 +7,8 @@ from app.middleware.logging_middleware import LoggingMiddleware
 from slowapi.errors import RateLimitExceeded
 from fastapi.responses import JSONResponse
 from app.core.limiter import limiter
+from app.utils.json_response import FastJSONResponse
+from app.core.config import PROFILING_ENABLED
 
 # Importar routers de la carpeta de endpoints
 from app.api.endpoints import auth, processing, crud, websocket, user_registration, user_management, export
@@ -14,9 +16,16 @@ from app.api.endpoints import auth, processing, crud, websocket, user_registrati
 # Importar el inicializador del worker de la cola de tareas
 from app.services.task_queue import start_graph_worker_loop
 
+# Importar las migraciones de base de datos (backfills e índices)
+from app.core.migrations import run_migrations
+
+# Importar el pool de procesos de bcrypt (para liberarlo al apagar)
+from app.core.auth import shutdown_bcrypt_pool, start_user_invalidation_listener, stop_user_invalidation_listener
+
 # Importar el tracker avanzado de memoria
 from app.utils.advanced_memory_tracker import advanced_memory_tracker, cleanup_advanced_memory_tracker
 from app.utils.log_filters import setup_logging_filters
+from app.utils.log_queue import start_queue_logging, stop_queue_logging
 import logging
 import atexit
 
@@ -27,10 +36,14 @@ logger = logging.getLogger(__name__)
 # Configurar filtros de logging personalizados
 setup_logging_filters()
 
+# Escribir los logs desde un thread aparte (el event loop solo encola)
+start_queue_logging()
+
 app = FastAPI(
     title="API Integrity AI Caución",
     description="API para el proyecto Integrity - AI Caución",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse,
 )
 
 # Configuración de CORS
@@ -57,6 +70,12 @@ app.add_middleware(CSRFMiddleware)
 # Middleware de logging personalizado
 app.add_middleware(LoggingMiddleware)
 
+# Profiling opcional (se agrega al final para envolver a todos los demás middlewares)
+if PROFILING_ENABLED:
+    from app.middleware.profiling import ProfilingMiddleware
+    app.add_middleware(ProfilingMiddleware)
+    logger.warning("⏱️ Profiling habilitado: agregar ?profile=1 a cualquier endpoint")
+
 # Configuración de SlowAPI
 app.state.limiter = limiter
 
@@ -87,6 +106,12 @@ async def startup_event():
     else:
         logger.info("🔍 Advanced Memory Tracker deshabilitado")
     
+    # Ejecutar migraciones idempotentes (backfills e índices)
+    await run_migrations()
+
+    # Invalidaciones del cache de usuarios entre workers (vía Redis)
+    start_user_invalidation_listener()
+    
     # Inicializar worker de procesamiento LangGraph
     start_graph_worker_loop()     # Worker LangGraph unificado
     
@@ -99,10 +124,20 @@ async def shutdown_event():
     # Limpiar el tracker de memoria
     cleanup_advanced_memory_tracker()
     
+    # Liberar el pool de procesos de bcrypt
+    shutdown_bcrypt_pool()
+
+    # Detener la suscripción de invalidaciones de usuarios
+    stop_user_invalidation_listener()
+    
     logger.info("✅ Aplicación detenida correctamente")
 
+    # Vaciar la cola de logs pendientes
+    stop_queue_logging()
+
 # Registrar limpieza al salir del proceso
 atexit.register(cleanup_advanced_memory_tracker)
+atexit.register(stop_queue_logging)
 
 if __name__ == "__main__":
     import uvicorn
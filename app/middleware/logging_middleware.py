@@ -7,11 +7,17 @@ from fastapi import Request, Response
 from fastapi.responses import StreamingResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from bson import ObjectId
+from cachetools import TTLCache
 
 from app.core.database import docs_collection
 
 logger = logging.getLogger("app.http")
 
+# (nombre, cuit) por documento: las vistas de un mismo documento se repiten en segundos
+# y el nombre o la empresa cambian rara vez; un desfase de un minuto en los logs es aceptable
+DOCUMENT_INFO_CACHE_TTL_SECONDS = 60
+_document_info_cache = TTLCache(maxsize=10_000, ttl=DOCUMENT_INFO_CACHE_TTL_SECONDS)
+
 
 class LoggingMiddleware(BaseHTTPMiddleware):
     """
@@ -53,17 +59,22 @@ class LoggingMiddleware(BaseHTTPMiddleware):
         Obtiene información del documento para enriquecer los logs.
         Retorna (company_name_or_filename, cuit)
         """
+        cached_info = _document_info_cache.get(docfile_id)
+        if cached_info is not None:
+            return cached_info
+
         try:
             object_id = ObjectId(docfile_id)
             document = await docs_collection.find_one(
                 {"_id": object_id}, 
-                {"name": 1, "company_info.company_name": 1, "company_info.company_cuit": 1}
+                {"_id": 0, "name": 1, "company_info.company_name": 1, "company_info.company_cuit": 1}
             )
             
             if document:
                 company_name = document.get("company_info", {}).get("company_name")
                 display_name = company_name if company_name else document.get("name", "Documento sin nombre")
                 cuit = document.get("company_info", {}).get("company_cuit", "N/A")
+                _document_info_cache[docfile_id] = (display_name, cuit)
                 return display_name, cuit
             
         except Exception as e:
@@ -74,16 +85,20 @@ class LoggingMiddleware(BaseHTTPMiddleware):
     def get_username_from_request(self, request: Request) -> str:
         """Extrae el username del usuario autenticado del request"""
         try:
+            # Si el endpoint autenticó al usuario, get_current_user ya dejó el username
+            username = getattr(request.state, "username", None)
+            if username:
+                return username
+
             # Intentar extraer el token de las cookies
             token = request.cookies.get("token")
             if not token:
                 return "Usuario no autenticado"
             
-            # Decodificar el token JWT
-            import jwt
-            from app.core.config import SECRET_KEY_AUTH, ALGORITHM
-            
-            payload = jwt.decode(token, SECRET_KEY_AUTH, algorithms=[ALGORITHM])
+            # Decodificar el token JWT (con cache de tokens ya verificados)
+            from app.core.auth import decode_access_token
+
+            payload = decode_access_token(token)
             username = payload.get("sub")
             return username if username else "Usuario desconocido"
             
@@ -0,0 +1,27 @@
+# app/middleware/profiling.py
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse
+from pyinstrument import Profiler
+from starlette.middleware.base import BaseHTTPMiddleware
+
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    """
+    Perfila una petición con pyinstrument cuando se agrega `?profile=1` a la URL
+    y devuelve el reporte HTML en lugar de la respuesta original.
+    Solo se registra si PROFILING_ENABLED=true (nunca en producción).
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        if request.query_params.get("profile") != "1":
+            return await call_next(request)
+
+        # async_mode="enabled" atribuye el tiempo en await a la corrutina que espera
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            await call_next(request)
+        finally:
+            profiler.stop()
+        return HTMLResponse(profiler.output_html())
@@ -1,9 +1,9 @@
 # app/models/users.py
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timezone
+from typing import List, Literal, Optional
 
 from bson import ObjectId
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, TypeAdapter
 
 
 class PyObjectId(ObjectId):
@@ -22,6 +22,12 @@ class PyObjectId(ObjectId):
         return {"type": "string"}
 
 
+# Valores admitidos en los parámetros de los endpoints de administración
+UserRole = Literal["user", "admin", "superadmin"]
+UserStatus = Literal["email_pending", "pending_approval", "active", "inactive", "rejected", "deleted"]
+ManageUserAction = Literal["deactivate", "activate", "change_role", "delete"]
+
+
 # ────────────────────────────────────────────────────────────────
 # Modelo completo que refleja TODO lo que guardamos en MongoDB.
 # Sólo se usa en la capa interna (DAO, servicios, etc.).
@@ -29,13 +35,17 @@ class PyObjectId(ObjectId):
 class User(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     username: str
+    username_lower: Optional[str] = None  # Copia en minúsculas para búsquedas indexadas
     email: EmailStr
+    email_lower: Optional[str] = None  # Copia en minúsculas para búsquedas indexadas
     first_name: str
     last_name: str
-    password_hash: str
+    # No viaja en el cache compartido del usuario actual (Redis): para verificar la
+    # contraseña del usuario autenticado usar auth.verify_current_password
+    password_hash: Optional[str] = None
     role: str = "user"
     status: str = "pending"
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     approved_at: Optional[datetime] = None
 
     # Nuevos campos para el sistema de registro
@@ -64,6 +74,20 @@ class User(BaseModel):
         json_encoders = {ObjectId: str}
 
 
+# Validador reutilizable de documentos de usuario: evita el binding de kwargs de User(**doc)
+# en los caminos calientes (get_current_user, WebSocket)
+USER_ADAPTER = TypeAdapter(User)
+
+# Usuario autenticado (get_current_user): todo menos los tokens de un solo uso.
+# Es una exclusión para no perder campos con default (p. ej. tenant_id) al agregar nuevos.
+USER_AUTH_PROJECTION = {
+    "email_verification_token": 0,
+    "email_verification_expires": 0,
+    "password_reset_token": 0,
+    "password_reset_expires": 0,
+}
+
+
 # ────────────────────────────────────────────────────────────────
 # Esquema **público**: lo que el backend devuelve al frontend.
 # No incluye password_hash ni otros datos sensibles.
@@ -87,6 +111,25 @@ class UserPublic(BaseModel):
         json_encoders = {ObjectId: str}
 
 
+# Proyección de MongoDB con solo los campos de UserPublic (sin hash ni tokens)
+USER_PUBLIC_PROJECTION = {
+    (field.alias or name): 1 for name, field in UserPublic.model_fields.items()
+}
+
+
+# ────────────────────────────────────────────────────────────────
+# Resumen mínimo para chequeos de permisos sobre otro usuario
+# (gestión de usuarios): evita validar el documento completo.
+# ────────────────────────────────────────────────────────────────
+class UserSummary(BaseModel):
+    username: str
+    role: str = "user"
+    status: str = "pending"
+
+
+USER_SUMMARY_PROJECTION = {name: 1 for name in UserSummary.model_fields}
+
+
 # ────────────────────────────────────────────────────────────────
 # Esquemas para requests
 # ────────────────────────────────────────────────────────────────
@@ -123,3 +166,7 @@ class ResetPasswordRequest(BaseModel):
 class UserManagementRequest(BaseModel):
     action: str  # "deactivate" | "activate" | "change_role"
     new_role: Optional[str] = None  # Solo para change_role
+
+
+class BulkApproveRequest(BaseModel):
+    user_ids: List[str] = Field(..., min_length=1, max_length=50)
@@ -0,0 +1,34 @@
+# app/services/document_counts.py
+"""
+Cache en memoria del total de documentos por filtro de /documents.
+Al paginar, el usuario repite el mismo filtro y solo cambia `page`: el total se reutiliza
+durante unos segundos y solo se consulta la página pedida.
+"""
+
+from typing import Hashable, Optional, Tuple
+
+from cachetools import TTLCache
+
+# TTL corto: los cambios de status que hace el worker no invalidan el cache,
+# así que el total puede quedar desfasado como mucho este tiempo.
+DOCUMENT_COUNT_CACHE_TTL_SECONDS = 30
+_document_count_cache = TTLCache(maxsize=10_000, ttl=DOCUMENT_COUNT_CACHE_TTL_SECONDS)
+
+
+def document_count_key(tenant_id: str, *filters: Hashable) -> Tuple[Hashable, ...]:
+    """Clave del cache: siempre encabezada por el tenant para poder invalidarlo completo."""
+    return (tenant_id, *filters)
+
+
+def get_cached_document_count(key: Tuple[Hashable, ...]) -> Optional[int]:
+    return _document_count_cache.get(key)
+
+
+def set_cached_document_count(key: Tuple[Hashable, ...], total: int) -> None:
+    _document_count_cache[key] = total
+
+
+def invalidate_tenant_counts(tenant_id: str) -> None:
+    """Descarta los totales cacheados de un tenant (tras altas, bajas o ediciones)."""
+    for key in [k for k in list(_document_count_cache.keys()) if k[0] == tenant_id]:
+        _document_count_cache.pop(key, None)
@@ -1,6 +1,6 @@
 # app/services/download_service.py
 
-from typing import Optional
+from typing import Optional, Tuple
 from bson import ObjectId
 from fastapi import HTTPException
 from urllib.parse import urlparse
@@ -14,7 +14,7 @@ async def get_document_download_url(
     docfile_id: str, 
     current_user: User,
     expiration: int = 900  # 15 minutos por defecto
-) -> str:
+) -> Tuple[str, dict]:
     """
     Genera una URL pre-firmada para descargar el archivo PDF original de un documento.
     
@@ -24,19 +24,24 @@ async def get_document_download_url(
         expiration: Tiempo de expiración de la URL en segundos (por defecto 15 minutos)
     
     Returns:
-        str: URL pre-firmada para descarga directa desde S3
+        Tuple[str, dict]: URL pre-firmada para descarga directa desde S3 y el documento
+        consultado (solo `_id`, `name` y `upload_path`, para derivar el nombre de archivo
+        sin otra consulta)
         
     Raises:
         HTTPException: Si el documento no existe, no tiene archivo o hay errores de acceso
     """
     # Validar ObjectId
-    try:
-        object_id = ObjectId(docfile_id)
-    except Exception:
+    if not ObjectId.is_valid(docfile_id):
         raise HTTPException(status_code=400, detail="ID de documento inválido")
+    object_id = ObjectId(docfile_id)
     
-    # Buscar el documento en la base de datos
-    document = await docs_collection.find_one({"_id": object_id})
+    # Buscar el documento en la base de datos (solo del tenant del usuario).
+    # Solo se traen los campos que usan la URL y el nombre de archivo.
+    document = await docs_collection.find_one(
+        {"_id": object_id, "tenant_id": current_user.tenant_id},
+        {"name": 1, "upload_path": 1},
+    )
     if not document:
         raise HTTPException(status_code=404, detail="Documento no encontrado")
     
@@ -61,7 +66,7 @@ async def get_document_download_url(
         
         # Generar URL pre-firmada
         presigned_url = generate_presigned_url(s3_key, expiration)
-        return presigned_url
+        return presigned_url, document
         
     except Exception as e:
         raise HTTPException(
@@ -17,6 +17,10 @@ import gc
 
 logger = logging.getLogger(__name__)
 
+# Expresiones regulares precompiladas
+INVALID_FILENAME_CHARS_RE = re.compile(r'[/\\:*?"<>|]')
+NON_DIGIT_RE = re.compile(r'\D')
+
 # Constantes de color
 COLOR_BORDER = '4a568d'
 COLOR_HEADER_BG = '4a568d'
@@ -77,8 +81,7 @@ def sanitize_filename(text: str, max_length: int = 100) -> str:
     Remueve caracteres no válidos y limita la longitud.
     """
     # Remover caracteres no válidos
-    invalid_chars = r'[/\\:*?"<>|]'
-    text = re.sub(invalid_chars, '', text)
+    text = INVALID_FILENAME_CHARS_RE.sub('', text)
     
     # Reemplazar espacios por guiones bajos
     text = text.replace(' ', '_')
@@ -110,7 +113,7 @@ def format_cuit(cuit: str) -> str:
         return "No disponible"
     
     # Remover cualquier caracter que no sea número
-    cuit_numbers = re.sub(r'\D', '', cuit)
+    cuit_numbers = NON_DIGIT_RE.sub('', cuit)
     
     # Verificar que tenga 11 dígitos
     if len(cuit_numbers) != 11:
@@ -188,7 +188,7 @@ async def process_document(
     docfile_id: str,
     requester: UserPublic,
     filename: str = None,
-    file_content: bytes = None
+    s3_pdf_key: str = None
 ) -> DocumentProcessingState:
     """
     Función principal para procesar un documento usando el graph de LangGraph.
@@ -198,7 +198,7 @@ async def process_document(
         docfile_id: ID del documento a procesar
         requester: Usuario que solicita el procesamiento
         filename: Nombre del archivo (requerido para complete_process)
-        file_content: Contenido del archivo (requerido para complete_process)
+        s3_pdf_key: Key del PDF ya subido a S3 (requerido para complete_process)
         
     Returns:
         DocumentProcessingState: Estado final del procesamiento
@@ -209,7 +209,7 @@ async def process_document(
         "requester": requester,
         "operation": operation,
         "filename": filename,
-        "file_content": file_content,
+        "s3_pdf_key": s3_pdf_key,
         "pages": None,
         "total_pages": None,
         "stop": None,
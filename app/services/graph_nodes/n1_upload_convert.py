@@ -7,16 +7,15 @@ import asyncio
 import gc
 from pdf2image import convert_from_path
 from bson import ObjectId
-from pydantic import SecretBytes
 from app.core.database import docs_collection
 # Imports de LangChain legacy eliminados
-from app.models.docs import DocFile
 from app.utils.status_notifier import update_status
 # TimingCallbackHandler legacy eliminado
 import tempfile
 from io import BytesIO
 import math
 from app.utils.memory_cleanup import try_malloc_trim  ##🧹 MALLOC_TRIM para upload_convert
+from app.utils.page_relevance import relevant_page_ids
 
 # Importamos el cliente de S3 y configuración
 from app.core.s3_client import s3_client
@@ -33,57 +32,21 @@ collection = docs_collection
 
 
 # -------------------------------------------------------------------------------
-# FUNCIÓN 1: SUBIR ARCHIVO PDF A S3 Y CREAR DOC EN BD
+# FUNCIÓN 1: REGISTRAR EN BD EL ARCHIVO PDF YA SUBIDO A S3
 # -------------------------------------------------------------------------------
 async def upload_file(state: DocumentProcessingState) -> DocumentProcessingState:
-    """Sube el archivo PDF a S3 y crea/actualiza el documento en MongoDB."""
-    filename = state['filename']
-    raw = state['file_content']
-    # si viene como SecretBytes, extrae .get_secret_value(), si no, úsalo tal cual
-    file_content = raw.get_secret_value() if isinstance(raw, SecretBytes) else raw
+    """
+    Registra en MongoDB el PDF que el endpoint ya subió a S3 en streaming
+    (el contenido del archivo nunca pasa por la cola ni por el worker).
+    """
+    docfile_id = state['docfile_id']
+    s3_key = state['s3_pdf_key']
     requester = state['requester']
     user_id = str(requester.id)
 
-    docfile_id = state.get('docfile_id')
-
-    # Si NO se provee docfile_id, creamos el DocFile en la BD
-    if not docfile_id:
-        uploaded_by = f"{requester.first_name} {requester.last_name}"
-        tenant_id = state.get('tenant_id', 'default')
-        
-        docfile = DocFile(
-            name=filename,
-            uploaded_by=uploaded_by,
-            status="En cola",
-            progress=0,
-            tenant_id=tenant_id
-        )
-
-        docfile_db = await collection.insert_one(docfile.model_dump(by_alias=True))
-        docfile_id = str(docfile_db.inserted_id)
-
     # Actualiza estado a "Cargando"
     await update_status(collection, docfile_id, "Cargando", user_id, send_progress_ws=True)
 
-    # Obtener configuración del tenant para rutas S3
-    tenant_id = state.get('tenant_id', 'default')
-    from app.services.tenant_config import get_tenant_config
-    tenant_config = get_tenant_config(tenant_id)
-    
-    # Key del archivo PDF en S3 usando prefijo del tenant
-    s3_key = f"{tenant_config.get_s3_prefix(docfile_id)}/pdf_file/{filename}"
-
-    # Subida asincrónica del PDF a S3
-    await asyncio.to_thread(
-        s3_client.put_object,
-        Bucket=S3_BUCKET_NAME,
-        Key=s3_key,
-        Body=file_content
-    )
-
-    # Liberar file_content inmediatamente después de subirlo
-    del file_content
-
     # URL pública en S3
     s3_pdf_url = f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/{s3_key}"
 
@@ -96,14 +59,7 @@ async def upload_file(state: DocumentProcessingState) -> DocumentProcessingState
     # Actualiza estado a "Cargado"
     await update_status(collection, docfile_id, "Cargado", user_id, send_progress_ws=True)
 
-    # Actualizar estado con docfile_id y datos S3
-    updated_state = state.copy()
-    updated_state.update({
-        "docfile_id": docfile_id,
-        "s3_pdf_key": s3_key,
-    })
-    
-    return updated_state
+    return state
 
 
 
@@ -292,7 +248,13 @@ async def convert_pdf_to_images(state: DocumentProcessingState) -> DocumentProce
         # Guardamos la información de las páginas en la BD y actualizamos el estado final a 100% y "Convertido"
         await collection.update_one(
             {"_id": ObjectId(docfile_id)},
-            {"$set": {"pages": pages, "page_count": total_pages, "status": "Convertido", "progress": 100}}
+            {"$set": {
+                "pages": pages,
+                "relevant_page_ids": relevant_page_ids(pages),
+                "page_count": total_pages,
+                "status": "Convertido",
+                "progress": 100,
+            }}
         )
         # Envía la actualización final por WebSocket asegurando el 100% y el estado final
         await update_status(collection, docfile_id, "Convertido", user_id, progress=100, page_count=total_pages ,update_db= False, send_progress_ws=True) # update_db=False aquí porque ya actualizamos arriba
@@ -373,7 +335,7 @@ async def upload_convert_node(state: DocumentProcessingState) -> DocumentProcess
     Nodo LangGraph para subida y conversión de PDF a imágenes.
     
     Ejecuta el proceso completo de:
-    1. Subida del archivo PDF a S3
+    1. Registro del archivo PDF (ya subido a S3 por el endpoint)
     2. Conversión del PDF a imágenes PNG
     3. Subida de las imágenes a S3
     4. Actualización del documento en MongoDB
@@ -392,7 +354,7 @@ async def upload_convert_node(state: DocumentProcessingState) -> DocumentProcess
     start_time = time.perf_counter()
     
     try:
-        # PASO 1: Subir archivo PDF a S3
+        # PASO 1: Registrar el archivo PDF subido a S3
         state = await upload_file(state)
         
         # PASO 2: Convertir PDF a imágenes
@@ -438,7 +400,6 @@ async def upload_convert_node(state: DocumentProcessingState) -> DocumentProcess
         updated_state = state.copy()
         updated_state.update({
             "filename": None,
-            "file_content": None,
         })
         
         return updated_state
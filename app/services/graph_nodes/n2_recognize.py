@@ -21,6 +21,7 @@ from app.utils.prompts import prompt_recognize_pages
 from app.utils.base64_utils import get_base64_encoded_image
 from app.utils.status_notifier import update_status
 from app.utils.memory_cleanup import try_malloc_trim  ##🧹 MALLOC_TRIM para recognize
+from app.utils.page_relevance import relevant_page_ids
 
 # Importamos el cliente de S3 y configuración
 from app.core.s3_client import s3_client
@@ -229,11 +230,13 @@ async def update_doc_pages(state: DocumentProcessingState) -> DocumentProcessing
 
     # Update Status: Reconocido
     await update_status(collection, docfile_id, "Reconocido", user_id, progress=100, update_db=False)    
+    pages_data = [page.model_dump(by_alias=True) for page in pages]
     await collection.update_one(
         {"_id": ObjectId(docfile_id)},
         {"$set": {
             "status": "Reconocido",
-            "pages": [page.model_dump(by_alias=True) for page in pages],
+            "pages": pages_data,
+            "relevant_page_ids": relevant_page_ids(pages_data),
             "progress": 100
         }}
     )
@@ -13,6 +13,8 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_anthropic import ChatAnthropic
 from langchain_google_genai import ChatGoogleGenerativeAI
 from app.utils.base64_utils import get_base64_encoded_image
+from app.utils.search_normalization import build_search_fields
+from app.utils.page_relevance import relevant_page_ids
 from app.models.docs_company_info import CompanyInfo
 from app.utils.prompts import prompt_extract_company_info
 
@@ -277,9 +279,10 @@ async def get_company_info_pages(state: DocumentProcessingState) -> DocumentProc
         else:
             page.company_info = False
     # Actualizar en la BD el campo company_info de todas las páginas de una sola vez
+    pages_data = [page.model_dump() for page in pages]
     await collection.update_one(
         {"_id": ObjectId(docfile_id)},
-        {"$set": {"pages": [page.model_dump() for page in pages]}}
+        {"$set": {"pages": pages_data, "relevant_page_ids": relevant_page_ids(pages_data)}}
     )
     
     # Actualizar estado con páginas de información de empresa
@@ -365,10 +368,15 @@ async def update_company_info(state: DocumentProcessingState) -> DocumentProcess
     company_info = state['extracted_company_info'].model_dump()
 
     # Actualizo el documento en la colección con los datos extraídos
+    # (junto con sus campos normalizados para la búsqueda de /documents)
     await collection.update_one(
         {"_id": ObjectId(docfile_id)},
         {"$set": {
-            "company_info": company_info
+            "company_info": company_info,
+            **build_search_fields(
+                company_name=company_info.get("company_name"),
+                company_cuit=company_info.get("company_cuit"),
+            ),
         }}
     )
 
@@ -65,10 +65,10 @@ async def route_operation(state: DocumentProcessingState) -> str:
 async def _route_complete_process(state: DocumentProcessingState) -> str:
     """
     Enrutamiento para complete_process.
-    Requiere filename y file_content para comenzar con upload_convert.
+    Requiere filename y s3_pdf_key para comenzar con upload_convert.
     """
-    if not state.get("filename") or not state.get("file_content"):
-        logger.error("complete_process requiere filename y file_content")
+    if not state.get("filename") or not state.get("s3_pdf_key"):
+        logger.error("complete_process requiere filename y s3_pdf_key")
         return "error_node"
     
     return "upload_convert_node"
@@ -40,7 +40,7 @@ class DocumentProcessingState(TypedDict):
     # DATOS ESPECÍFICOS PARA COMPLETE_PROCESS
     # ------------------------------------------------------------------------------------
     filename: Optional[str]            # Nombre del archivo original (requerido para complete_process)
-    file_content: Optional[bytes]      # Contenido del archivo PDF (requerido para complete_process)
+    s3_pdf_key: Optional[str]          # Key del PDF ya subido a S3 (requerido para complete_process)
     
     # ------------------------------------------------------------------------------------
     # ESTADO DEL PROCESAMIENTO
@@ -24,7 +24,7 @@ async def enqueue_graph_processing(
     docfile_id: str,
     requester: UserPublic,
     filename: Optional[str] = None,
-    file_content: Optional[bytes] = None
+    s3_pdf_key: Optional[str] = None
 ):
     """
     Encola una tarea de procesamiento del graph con la operación especificada.
@@ -37,26 +37,20 @@ async def enqueue_graph_processing(
         docfile_id: ID del documento a procesar
         requester: Usuario que solicita el procesamiento
         filename: Nombre del archivo (requerido solo para complete_process)
-        file_content: Contenido del archivo (requerido solo para complete_process)
+        s3_pdf_key: Key del PDF ya subido a S3 (requerido solo para complete_process)
     """
     try:
         # Validaciones específicas por operación
         if operation == "complete_process":
-            if not filename or not file_content:
-                raise ValueError("complete_process requiere filename y file_content")
+            if not filename or not s3_pdf_key:
+                raise ValueError("complete_process requiere filename y s3_pdf_key")
         
         # Crear tupla con los datos de la tarea
-        task_data = (operation, docfile_id, requester, filename, file_content)
+        task_data = (operation, docfile_id, requester, filename, s3_pdf_key)
         
         await graph_queue.put(task_data)
         
-        # Log detallado del encolado
-        file_size_info = ""
-        if file_content:
-            file_size_mb = len(file_content) / (1024 * 1024)
-            file_size_info = f" - Tamaño: {file_size_mb:.2f}MB"
-        
-        logging.info(f"[GRAPH_QUEUE] Tarea encolada: {operation} - {docfile_id}{file_size_info}")
+        logging.info(f"[GRAPH_QUEUE] Tarea encolada: {operation} - {docfile_id}")
         
         # Log estado de la cola
         queue_size = graph_queue.qsize()
@@ -82,20 +76,14 @@ async def graph_worker():
         operation = None
         docfile_id = None
         filename = None
-        file_content = None
+        s3_pdf_key = None
         requester = None
         
         try:
             # Obtener tarea de la cola
-            operation, docfile_id, requester, filename, file_content = await graph_queue.get()
-            
-            # Log detallado del inicio
-            file_size_info = ""
-            if file_content:
-                file_size_mb = len(file_content) / (1024 * 1024)
-                file_size_info = f" - Tamaño: {file_size_mb:.2f}MB"
+            operation, docfile_id, requester, filename, s3_pdf_key = await graph_queue.get()
             
-            logging.info(f"[GRAPH_QUEUE] Iniciando procesamiento: {operation} - {docfile_id}{file_size_info}")
+            logging.info(f"[GRAPH_QUEUE] Iniciando procesamiento: {operation} - {docfile_id}")
             
             # Obtener memoria inicial para este documento específico
             if tracemalloc.is_tracing():
@@ -108,7 +96,7 @@ async def graph_worker():
                 docfile_id=docfile_id,
                 requester=requester,
                 filename=filename,
-                file_content=file_content
+                s3_pdf_key=s3_pdf_key
             )
             
             # Verificar si hubo errores
@@ -152,8 +140,8 @@ async def graph_worker():
                         logging.info(f"[GRAPH_QUEUE] Iniciando limpieza de memoria para: {operation} - {docfile_id}")
                 
                 # Liberar variables explícitamente
-                if file_content:
-                    del file_content
+                if s3_pdf_key:
+                    del s3_pdf_key
                 if filename:
                     del filename
                 if requester:
@@ -0,0 +1,68 @@
+# app/services/user_listings_cache.py
+"""
+Cache de respuestas de los listados de administración (/pending-users y /users).
+Los paneles de admin se refrescan seguido y toleran unos segundos de desfase.
+Con Redis el cache se comparte entre workers; sin REDIS_URL se usa un cache en memoria.
+"""
+
+import logging
+from typing import Any, Optional
+
+import orjson
+from cachetools import TTLCache
+
+from app.core.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+USER_LISTINGS_CACHE_TTL_SECONDS = 10
+
+# Todas las entradas viven en un único hash de Redis: invalidar es un solo DEL
+USER_LISTINGS_REDIS_KEY = "users_list"
+
+_local_user_listings = TTLCache(maxsize=1_000, ttl=USER_LISTINGS_CACHE_TTL_SECONDS)
+
+
+def user_listing_key(*parts: Any) -> str:
+    """Clave del listado a partir de los parámetros que cambian la respuesta."""
+    return "|".join("" if part is None else str(part) for part in parts)
+
+
+async def get_cached_user_listing(key: str) -> Optional[Any]:
+    """Devuelve la respuesta cacheada o None."""
+    if redis_client:
+        try:
+            cached = await redis_client.hget(USER_LISTINGS_REDIS_KEY, key)
+        except Exception as e:
+            logger.warning(f"[USER_LISTINGS_CACHE] Error leyendo de Redis: {str(e)}")
+            return None
+        return orjson.loads(cached) if cached is not None else None
+    return _local_user_listings.get(key)
+
+
+async def set_cached_user_listing(key: str, payload: Any) -> None:
+    """
+    Guarda una respuesta. En Redis el TTL es del hash completo y solo se fija al crearlo,
+    así ninguna entrada queda desfasada más de USER_LISTINGS_CACHE_TTL_SECONDS.
+    """
+    if redis_client:
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.hset(USER_LISTINGS_REDIS_KEY, key, orjson.dumps(payload, default=str))
+                pipe.expire(USER_LISTINGS_REDIS_KEY, USER_LISTINGS_CACHE_TTL_SECONDS, nx=True)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"[USER_LISTINGS_CACHE] Error escribiendo en Redis: {str(e)}")
+        return
+    _local_user_listings[key] = payload
+
+
+async def invalidate_user_listings() -> None:
+    """Descarta todos los listados cacheados (tras altas, aprobaciones o cambios de usuarios)."""
+    if redis_client:
+        try:
+            await redis_client.delete(USER_LISTINGS_REDIS_KEY)
+        except Exception as e:
+            logger.warning(f"[USER_LISTINGS_CACHE] Error invalidando en Redis: {str(e)}")
+        return
+    _local_user_listings.clear()
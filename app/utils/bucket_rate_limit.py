@@ -0,0 +1,41 @@
+# app/utils/bucket_rate_limit.py
+"""
+Rate limiting en proceso con memoria acotada: los contadores viven en buckets de tiempo
+y las claves desaparecen solas al descartarse el bucket más viejo.
+"""
+
+import time
+from collections import defaultdict, deque
+from typing import DefaultDict, Deque, Hashable
+
+
+class BucketTimeRateLimit:
+    """
+    Ventana deslizante aproximada con buckets de tiempo fijos.
+    Cada bucket cuenta requests por clave; el más viejo se descarta al pasar su minuto.
+    La rotación se hace al registrar una request, sin tareas en segundo plano.
+    """
+
+    def __init__(self, bucket_seconds: int, buckets: int, max_requests: int):
+        self.bucket_seconds = bucket_seconds
+        self.max_requests = max_requests
+        self._buckets: Deque[DefaultDict[Hashable, int]] = deque(
+            (defaultdict(int) for _ in range(buckets)), maxlen=buckets
+        )
+        self._current_slot = int(time.monotonic() // bucket_seconds)
+
+    def _rotate(self) -> None:
+        slot = int(time.monotonic() // self.bucket_seconds)
+        # Un bucket vacío por cada minuto transcurrido (como máximo, la ventana completa)
+        for _ in range(min(slot - self._current_slot, self._buckets.maxlen)):
+            self._buckets.append(defaultdict(int))
+        self._current_slot = slot
+
+    def hit(self, key: Hashable) -> bool:
+        """Registra una request y devuelve False si la clave superó el máximo de la ventana."""
+        self._rotate()
+        total = sum(bucket.get(key, 0) for bucket in self._buckets)
+        if total >= self.max_requests:
+            return False
+        self._buckets[-1][key] += 1
+        return True
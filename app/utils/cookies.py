@@ -40,3 +40,17 @@ def attach_auth_cookies(
     )
 
     return csrf_token
+
+
+def build_logout_cookie_headers(
+    domain: str | None,
+    cookie_names: tuple[str, ...] = ("token", "csrf_token"),
+) -> list[tuple[bytes, bytes]]:
+    """
+    Genera una sola vez los headers `Set-Cookie` que borran las cookies de sesión.
+    Son estáticos para un dominio dado, así que /logout puede reutilizarlos tal cual.
+    """
+    template = Response()
+    for name in cookie_names:
+        template.delete_cookie(name, path="/", domain=domain)
+    return [header for header in template.raw_headers if header[0] == b"set-cookie"]
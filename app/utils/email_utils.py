@@ -1,8 +1,9 @@
 # app/utils/email_utils.py
 
+import logging
 import os
 from datetime import datetime, timezone
-from typing import List, Dict, Any
+from typing import Any, Awaitable, Callable, Dict, List
 from jinja2 import Template
 from app.core.email import email_service
 from app.core.config import (
@@ -15,6 +16,8 @@ from app.core.config import (
 )
 from app.core.database import users_collection
 
+logger = logging.getLogger(__name__)
+
 
 def load_template(template_name: str) -> Template:
     """
@@ -30,6 +33,25 @@ def load_template(template_name: str) -> Template:
     return Template(template_content)
 
 
+def email_delivery_available() -> bool:
+    """Indica si hay servicio de email configurado (los envíos encolados no son no-ops)."""
+    return email_service is not None
+
+
+async def run_email_task(send_fn: Callable[..., Awaitable[bool]], *args: Any) -> None:
+    """
+    Ejecuta un `send_*_email` como BackgroundTask, después de enviar la respuesta HTTP.
+    Los fallos solo se loggean: el request ya terminó.
+    """
+    try:
+        email_sent = await send_fn(*args)
+    except Exception as e:
+        logger.error(f"[EMAIL] Error en {send_fn.__name__}: {str(e)}")
+        return
+    if not email_sent:
+        logger.warning(f"[EMAIL] {send_fn.__name__} no pudo enviar el email")
+
+
 # Helper para convertir datetimes a timezone de Argentina
 def to_argentina(dt: datetime) -> datetime:
     """Convierte un datetime a la zona horaria ARGENTINA_TZ.
@@ -99,11 +121,13 @@ async def send_admin_notification_email(user_data: Dict[str, Any]) -> bool:
     admin_emails = []
     if NOTIFY_ALL_ADMINS:
         # Obtener todos los admins de la base de datos
-        admins_cursor = users_collection.find({"role": {"$in": ["admin", "superadmin"]}})
+        admins_cursor = users_collection.find(
+            {"role": {"$in": ["admin", "superadmin"]}}, {"email": 1, "_id": 0}
+        )
         admin_emails = [admin["email"] async for admin in admins_cursor]
     else:
         # Usar lista específica de emails
-        admin_emails = [email.strip() for email in ADMIN_NOTIFICATION_EMAILS if email.strip()]
+        admin_emails = list(ADMIN_NOTIFICATION_EMAILS)
     
     if not admin_emails:
         return False
@@ -0,0 +1,18 @@
+# app/utils/json_response.py
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+class FastJSONResponse(ORJSONResponse):
+    """
+    Respuesta JSON serializada con orjson.
+    Los tipos que orjson no conoce (ObjectId y otros de BSON) se convierten a string.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content,
+            default=str,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        )
@@ -0,0 +1,44 @@
+# app/utils/log_queue.py
+"""
+Logging no bloqueante: los handlers del logger raíz pasan a un thread (QueueListener)
+y el event loop solo encola el registro. Escribir a stdout/archivo con presión de
+buffer deja de frenar a las requests en curso.
+"""
+
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+_queue_listener: Optional[QueueListener] = None
+
+
+def start_queue_logging():
+    """Reemplaza los handlers del logger raíz por un QueueHandler. Idempotente."""
+    global _queue_listener
+    if _queue_listener is not None:
+        return
+
+    root_logger = logging.getLogger()
+    handlers = list(root_logger.handlers)
+    if not handlers:
+        return
+
+    # Sin límite: un put_nowait nunca falla ni bloquea
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    for handler in handlers:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(QueueHandler(log_queue))
+
+    # Los filtros de log_filters siguen en los handlers reales y corren en el thread
+    _queue_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _queue_listener.start()
+
+
+def stop_queue_logging():
+    """Vacía la cola y detiene el thread del listener (al apagar la aplicación)."""
+    global _queue_listener
+    if _queue_listener is None:
+        return
+    _queue_listener.stop()
+    _queue_listener = None
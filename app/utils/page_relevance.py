@@ -0,0 +1,34 @@
+# app/utils/page_relevance.py
+"""
+Criterio de "página relevante" de un documento (las que devuelve /document/{id}).
+Se calcula al escribir las páginas y se guarda en `relevant_page_ids` (índices dentro
+de `pages`), para que la lectura no tenga que recorrer todas las páginas.
+"""
+
+from typing import Any, Dict, List
+
+
+def is_relevant_page(page: Dict[str, Any]) -> bool:
+    """Página de balance, de estado de resultados o con el campo `company_info` presente."""
+    recognized_info = page.get("recognized_info") or {}
+    return (
+        recognized_info.get("is_balance_sheet") is True
+        or recognized_info.get("is_income_statement_sheet") is True
+        or page.get("company_info") is not None
+    )
+
+
+def relevant_page_ids(pages: List[Dict[str, Any]]) -> List[int]:
+    """Índices (base 0) de las páginas relevantes, en orden."""
+    return [index for index, page in enumerate(pages) if is_relevant_page(page)]
+
+
+def relevant_page_expr(page: str) -> Dict[str, Any]:
+    """Mismo criterio que `is_relevant_page`, como expresión de agregación sobre `page`."""
+    return {
+        "$or": [
+            {"$eq": [{"$ifNull": [f"{page}.recognized_info.is_balance_sheet", False]}, True]},
+            {"$eq": [{"$ifNull": [f"{page}.recognized_info.is_income_statement_sheet", False]}, True]},
+            {"$ne": [{"$ifNull": [f"{page}.company_info", None]}, None]},
+        ]
+    }
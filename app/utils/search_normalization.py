@@ -0,0 +1,45 @@
+# app/utils/search_normalization.py
+
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+# Campos normalizados que se guardan en cada documento para la búsqueda `q` de /documents
+SEARCH_FIELDS = (
+    "name_normalized",
+    "uploaded_by_normalized",
+    "company_name_normalized",
+    "company_cuit_normalized",
+)
+
+
+def normalize_search_text(value: Optional[str]) -> str:
+    """
+    Normaliza un texto para búsquedas: quita tildes/diacríticos y lo pasa a minúsculas.
+    Ejemplo: 'Ingeniería Núñez' -> 'ingenieria nunez'
+    """
+    if not value:
+        return ""
+    return unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode().lower()
+
+
+def build_search_fields(**values: Optional[str]) -> Dict[str, str]:
+    """
+    Construye los campos `<campo>_normalized` a persistir junto a los originales.
+    Ejemplo: build_search_fields(name="Balance 2023.pdf") -> {"name_normalized": "balance 2023.pdf"}
+    """
+    return {f"{field}_normalized": normalize_search_text(value) for field, value in values.items()}
+
+
+@lru_cache(maxsize=2048)
+def search_prefix_bounds(query: str) -> Optional[Tuple[str, str]]:
+    """
+    Límites [inferior, superior) del rango equivalente a `^query` sobre un campo normalizado.
+    A diferencia de `$regex`, Mongo lo resuelve como un recorrido acotado del índice.
+    Memoizado: las búsquedas se repiten mucho (paginación, autocompletado).
+    Ejemplo: search_prefix_bounds("Bal") -> ("bal", "bam"); devuelve None si no queda texto.
+    """
+    prefix = normalize_search_text(query)
+    if not prefix:
+        return None
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
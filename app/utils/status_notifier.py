@@ -1,6 +1,6 @@
 # app/utils/status_notifier.py
 
-import json
+import orjson
 from bson import ObjectId
 from app.websockets.manager import manager
 
@@ -85,5 +85,6 @@ async def update_status(
         if error_message:
             message_payload["error_message"] = error_message
 
-        message = json.dumps(message_payload)
+        # orjson (en C) en lugar de json.dumps; se envía como texto, igual que antes
+        message = orjson.dumps(message_payload, default=str).decode()
         await manager.broadcast(user_id, message)
@@ -1,3 +1,4 @@
+import asyncio
 import time
 import threading
 import logging
@@ -6,11 +7,28 @@ from typing import Any, Dict, List, Optional, Union, cast
 from bson import ObjectId
 
 from langchain_core.callbacks.base import BaseCallbackHandler
-from app.core.database import docs_collection
+from app.core.database import docs_collection, get_loop_database
 from app.models.docs_processing_time import ProcessingTime
 
 logger = logging.getLogger(__name__)
 
+# Event loop persistente para las actualizaciones de timing: los callbacks pueden correr
+# fuera del loop de la app, así que todas las actualizaciones van a este loop (en su
+# propio thread), que reutiliza un único cliente de MongoDB.
+_timing_loop: Optional[asyncio.AbstractEventLoop] = None
+_timing_loop_lock = threading.Lock()
+
+
+def _get_timing_loop() -> asyncio.AbstractEventLoop:
+    global _timing_loop
+    with _timing_loop_lock:
+        if _timing_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="timing-updates", daemon=True).start()
+            _timing_loop = loop
+    return _timing_loop
+
+
 class TimingCallbackHandler(BaseCallbackHandler):
     def __init__(self, stage_name: str) -> None:
         """
@@ -129,16 +147,11 @@ class TimingCallbackHandler(BaseCallbackHandler):
 
     async def _update_processing_time(self, docfile_id: str, duration: float, user_id: str = "N/A") -> None:
         """Actualiza el tiempo de procesamiento en la base de datos y envía notificación WebSocket."""
-        client = None
         try:
-            from motor.motor_asyncio import AsyncIOMotorClient
-            from app.core.config import MONGO_URI, MONGO_DB
             from app.utils.status_notifier import update_status
             
-            # Crear una nueva conexión para este event loop
-            client = AsyncIOMotorClient(MONGO_URI)
-            db = client[MONGO_DB]
-            collection = db.documents
+            # Cliente del loop de timing: se crea una vez y se reutiliza
+            collection = get_loop_database().documents
             
             object_id = ObjectId(docfile_id)
             
@@ -183,31 +196,13 @@ class TimingCallbackHandler(BaseCallbackHandler):
             
         except Exception as e:
             logger.error(f"Error actualizando tiempo de procesamiento: {e}")
-        finally:
-            # Cerrar la conexión de forma segura en el bloque finally
-            if client is not None:
-                try:
-                    client.close()  # Usar close() síncrono en lugar de await client.close()
-                except Exception as close_error:
-                    logger.error(f"Error cerrando conexión MongoDB: {close_error}")
 
     def _schedule_update_processing_time_sync(self, docfile_id: str, duration: float, user_id: str = "N/A") -> None:
         """Programa la actualización del tiempo de procesamiento de forma síncrona y segura."""
-        import asyncio
-        import threading
-        
-        def run_update():
-            try:
-                # Crear un nuevo event loop para este thread
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                try:
-                    loop.run_until_complete(self._update_processing_time(docfile_id, duration, user_id))
-                finally:
-                    loop.close()
-            except Exception as e:
-                logger.error(f"Error en thread de actualización de timing: {e}")
-        
-        # Ejecutar en un thread separado para evitar problemas con el event loop
-        thread = threading.Thread(target=run_update, daemon=True)
-        thread.start()
\ No newline at end of file
+        try:
+            # Se encola en el loop de timing: no bloquea al llamador ni depende de su event loop
+            asyncio.run_coroutine_threadsafe(
+                self._update_processing_time(docfile_id, duration, user_id), _get_timing_loop()
+            )
+        except Exception as e:
+            logger.error(f"Error programando actualización de timing: {e}")
\ No newline at end of file
@@ -1,7 +1,7 @@
 # app/utils/token_utils.py
 
 import secrets
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from app.core.config import TOKEN_EXPIRATION_HOURS
 
 
@@ -16,11 +16,14 @@ def get_token_expiration() -> datetime:
     """
     Retorna la fecha de expiración para tokens (24h por defecto).
     """
-    return datetime.utcnow() + timedelta(hours=TOKEN_EXPIRATION_HOURS)
+    return datetime.now(timezone.utc) + timedelta(hours=TOKEN_EXPIRATION_HOURS)
 
 
 def is_token_expired(expires_at: datetime) -> bool:
     """
     Verifica si un token ha expirado.
+    Mongo devuelve las fechas naive (en UTC): se les asigna UTC antes de comparar.
     """
-    return datetime.utcnow() > expires_at
+    if expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) > expires_at